@@ -1,11 +1,16 @@
 import os
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from .config import DevConfig, ProdConfig
 from .extensions import db, login_manager, migrate, csrf
 from .auth import auth_bp
 from .main import main_bp
 from .admin import admin_bp
+from .health import health_bp
 from .cli import register_cli
+from .instrumentation import init_app as init_instrumentation
+from .assets import init_app as init_assets
+from .routing import init_app as init_routing
 
 
 def create_app():
@@ -23,7 +28,12 @@ def create_app():
     else:
         app.config.from_object(DevConfig)
 
+    hops = app.config.get("PROXY_FIX_HOPS", 0)
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
     db.init_app(app)
+    init_routing(app, db)
     login_manager.init_app(app)
     migrate.init_app(app, db)
     csrf.init_app(app)
@@ -33,6 +43,9 @@ def create_app():
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
     app.register_blueprint(admin_bp, url_prefix="/admin")
+    app.register_blueprint(health_bp)
 
     register_cli(app)
+    init_instrumentation(app)
+    init_assets(app)
     return app
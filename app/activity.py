@@ -0,0 +1,72 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+import json
+from .extensions import db
+from .models import ActivityLog, ActivityRollup
+from .utils import upsert
+
+
+def _seconds(meta_json):
+    try:
+        return int(json.loads(meta_json or "{}").get("seconds", 0))
+    except (ValueError, TypeError, AttributeError):
+        return 0
+
+
+def _compact(condition, batch_size):
+    # Walk expired rows in id order, folding each batch into the rollup table
+    compacted = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(ActivityLog.id, ActivityLog.user_id, ActivityLog.action, ActivityLog.created_at, ActivityLog.meta_json)
+            .where(condition, ActivityLog.id > last_id)
+            .order_by(ActivityLog.id.asc())
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return compacted
+
+        totals = defaultdict(lambda: [0, 0])
+        for row in rows:
+            bucket = totals[(row.user_id, row.created_at.date(), row.action)]
+            bucket[0] += 1
+            if row.action == "time_log":
+                bucket[1] += _seconds(row.meta_json)
+        upsert(
+            ActivityRollup,
+            [
+                {"user_id": user_id, "day": day, "action": action, "count": count, "seconds": seconds}
+                for (user_id, day, action), (count, seconds) in totals.items()
+            ],
+            index_elements=["user_id", "day", "action"],
+            increment=["count", "seconds"],
+        )
+        first_id, last_id = rows[0].id, rows[-1].id
+        db.session.execute(
+            db.delete(ActivityLog).where(condition, ActivityLog.id.between(first_id, last_id))
+        )
+        db.session.commit()
+        compacted += len(rows)
+
+
+def rollup_activity(retention_days, time_log_retention_days, rollup_retention_days=0, now=None, batch_size=5000):
+    now = now or datetime.utcnow()
+    day_start = datetime.combine(now.date(), datetime.min.time())
+    time_log_cutoff = day_start - timedelta(days=time_log_retention_days)
+    cutoff = day_start - timedelta(days=retention_days)
+
+    compacted = _compact(
+        db.and_(ActivityLog.action == "time_log", ActivityLog.created_at < time_log_cutoff),
+        batch_size,
+    )
+    compacted += _compact(ActivityLog.created_at < cutoff, batch_size)
+
+    purged = 0
+    if rollup_retention_days:
+        result = db.session.execute(
+            db.delete(ActivityRollup).where(ActivityRollup.day < now.date() - timedelta(days=rollup_retention_days))
+        )
+        purged = result.rowcount
+        db.session.commit()
+    return compacted, purged
@@ -1,10 +1,15 @@
-import json
+import io
 from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
 from flask_login import login_required, current_user
+from . import analytics
+from .catalog import catalog
 from .extensions import db
 from .forms import ChapterForm, ProblemForm
+from .export import export_response
+from .importer import ProblemImporter, iter_json, iter_ndjson
 from .models import Chapter, Problem, Tag
-from .utils import slugify
+from .search import index_problems
+from .utils import slugify, add_chapter_problems, bump_catalog_version
 
 
 admin_bp = Blueprint("admin", __name__)
@@ -19,8 +24,7 @@ def _require_admin():
 @login_required
 def index():
     _require_admin()
-    chapters = Chapter.query.order_by(Chapter.position.asc()).all()
-    return render_template("admin/index.html", chapters=chapters)
+    return render_template("admin/index.html", chapters=catalog.chapters())
 
 
 @admin_bp.route("/chapters/new", methods=["GET", "POST"])
@@ -35,6 +39,7 @@ def new_chapter():
             position=form.position.data or 0,
         )
         db.session.add(chapter)
+        bump_catalog_version()
         db.session.commit()
         flash("Chapter created.", "success")
         return redirect(url_for("admin.index"))
@@ -46,7 +51,7 @@ def new_chapter():
 def new_problem():
     _require_admin()
     form = ProblemForm()
-    chapters = Chapter.query.order_by(Chapter.position.asc()).all()
+    chapters = catalog.chapters()
     if form.validate_on_submit():
         chapter_id = int(request.form.get("chapter_id"))
         problem = Problem(
@@ -64,6 +69,9 @@ def new_problem():
                 db.session.add(tag)
             problem.tags.append(tag)
         db.session.add(problem)
+        db.session.flush()
+        add_chapter_problems(chapter_id)
+        index_problems([problem.id])
         db.session.commit()
         flash("Problem created.", "success")
         return redirect(url_for("admin.index"))
@@ -75,37 +83,40 @@ def new_problem():
 def bulk_import():
     _require_admin()
     if request.method == "POST":
-        raw = request.form.get("payload", "")
+        upload = request.files.get("file")
+        if upload and upload.filename:
+            stream = io.TextIOWrapper(upload.stream, encoding="utf-8")
+            ndjson = upload.filename.endswith((".ndjson", ".jsonl"))
+        else:
+            stream = io.StringIO(request.form.get("payload", ""))
+            ndjson = request.form.get("format") == "ndjson"
+        importer = ProblemImporter()
         try:
-            data = json.loads(raw)
-        except json.JSONDecodeError:
-            flash("Invalid JSON.", "error")
+            created, skipped = importer.run(iter_ndjson(stream) if ndjson else iter_json(stream))
+        except ValueError:
+            db.session.rollback()
+            flash(f"Invalid import payload ({importer.created} problems imported before the error).", "error")
             return render_template("admin/import.html")
-        created = 0
-        for chapter_data in data.get("chapters", []):
-            chapter = Chapter.query.filter_by(slug=slugify(chapter_data["title"])).first()
-            if not chapter:
-                chapter = Chapter(title=chapter_data["title"], slug=slugify(chapter_data["title"]), position=chapter_data.get("position", 0))
-                db.session.add(chapter)
-                db.session.flush()
-            for p in chapter_data.get("problems", []):
-                problem = Problem(
-                    chapter_id=chapter.id,
-                    title=p["title"],
-                    difficulty=p.get("difficulty", "easy"),
-                    points=p.get("points", 10),
-                    prompt=p.get("prompt", ""),
-                )
-                tags = [t.strip().lower() for t in p.get("tags", []) if t.strip()]
-                for tag_name in tags:
-                    tag = Tag.query.filter_by(name=tag_name).first()
-                    if not tag:
-                        tag = Tag(name=tag_name)
-                        db.session.add(tag)
-                    problem.tags.append(tag)
-                db.session.add(problem)
-                created += 1
-        db.session.commit()
-        flash(f"Imported {created} problems.", "success")
+        flash(f"Imported {created} problems ({skipped} already present).", "success")
+        for number, title, reason in importer.invalid[:20]:
+            flash(f"Skipped record {number} {title!r}: {reason}", "error")
         return redirect(url_for("admin.index"))
     return render_template("admin/import.html")
+
+
+@admin_bp.route("/export/<dataset>.<fmt>")
+@login_required
+def export_data(dataset, fmt):
+    _require_admin()
+    return export_response(dataset, fmt, user_id=request.args.get("user_id", type=int))
+
+
+@admin_bp.route("/analytics")
+@login_required
+def analytics_dashboard():
+    _require_admin()
+    sort = request.args.get("sort", "hardest")
+    if sort not in analytics.SORTS:
+        sort = "hardest"
+    data = analytics.dashboard(sort=sort)
+    return render_template("admin/analytics.html", sort=sort, sorts=analytics.SORTS, catalog=catalog, **data)
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+from statistics import median
+from flask import current_app
+from sqlalchemy import case, or_
+from .extensions import db
+from .models import (
+    ActivityLog, ActivityRollup, AnalyticsWatermark, DailyActiveUsers, ProblemSummary, UserProblem,
+)
+from .utils import upsert
+
+
+# Summary tables are refreshed from a high-water mark: only problems whose
+# progress rows changed since the last run (plus rows that have since aged
+# into "abandoned") and only days with new activity are recomputed, each
+# from scratch, so re-running over an overlapping window is harmless.
+
+OVERLAP = timedelta(minutes=5)  # rows committed late by long transactions
+BATCH_SIZE = 500
+
+
+def _watermark(name):
+    return db.session.get(AnalyticsWatermark, name)
+
+
+def _set_watermark(name, value):
+    upsert(AnalyticsWatermark, {"name": name, "value": value}, index_elements=["name"], replace=["value"])
+
+
+def _summarize_problems(problem_ids, abandon_before, now):
+    is_solved = UserProblem.status == "solved"
+    counts = db.session.execute(
+        db.select(
+            UserProblem.problem_id,
+            db.func.count(),
+            db.func.sum(case((is_solved, 1), else_=0)),
+            db.func.sum(case((~is_solved & (UserProblem.updated_at < abandon_before), 1), else_=0)),
+        )
+        .where(UserProblem.problem_id.in_(problem_ids))
+        .group_by(UserProblem.problem_id)
+    ).all()
+    times = {}
+    for problem_id, seconds in db.session.execute(
+        db.select(UserProblem.problem_id, UserProblem.time_spent_sec)
+        .where(UserProblem.problem_id.in_(problem_ids), is_solved)
+    ):
+        times.setdefault(problem_id, []).append(seconds or 0)
+    rows = [
+        {
+            "problem_id": problem_id,
+            "started": started,
+            "solved": solved or 0,
+            "abandoned": abandoned or 0,
+            "solve_rate": (solved or 0) / started if started else 0.0,
+            "median_solve_sec": int(median(times[problem_id])) if problem_id in times else None,
+            "refreshed_at": now,
+        }
+        for problem_id, started, solved, abandoned in counts
+    ]
+    if rows:
+        upsert(
+            ProblemSummary,
+            rows,
+            index_elements=["problem_id"],
+            replace=["started", "solved", "abandoned", "solve_rate", "median_solve_sec", "refreshed_at"],
+        )
+
+
+def refresh_problem_summary(now=None):
+    now = now or datetime.utcnow()
+    abandon_before = now - timedelta(days=current_app.config.get("ANALYTICS_ABANDON_DAYS", 14))
+    mark = _watermark("problems")
+    touched = db.select(UserProblem.problem_id).distinct()
+    if mark:
+        since = mark.value - OVERLAP
+        # Rows that crossed the abandonment cutoff since the last run
+        crossed = UserProblem.updated_at.between(since - (now - abandon_before), abandon_before)
+        touched = touched.where(or_(UserProblem.updated_at > since, crossed))
+    problem_ids = db.session.execute(touched).scalars().all()
+    for start in range(0, len(problem_ids), BATCH_SIZE):
+        _summarize_problems(problem_ids[start:start + BATCH_SIZE], abandon_before, now)
+    _set_watermark("problems", now)
+    db.session.commit()
+    return len(problem_ids)
+
+
+def refresh_daily_active_users(now=None):
+    now = now or datetime.utcnow()
+    mark = _watermark("dau")
+    if mark:
+        first = (mark.value - OVERLAP).date()
+    else:
+        # First run: backfill from compacted rollups as well as the raw log
+        starts = [
+            db.session.execute(db.select(db.func.min(ActivityLog.created_at))).scalar(),
+            db.session.execute(db.select(db.func.min(ActivityRollup.day))).scalar(),
+        ]
+        starts = [s.date() if isinstance(s, datetime) else s for s in starts if s]
+        first = min(starts) if starts else now.date()
+
+    days = 0
+    day = first
+    while day <= now.date():
+        start = datetime.combine(day, datetime.min.time())
+        active = db.union(
+            db.select(ActivityLog.user_id).where(
+                ActivityLog.created_at >= start, ActivityLog.created_at < start + timedelta(days=1)
+            ),
+            db.select(ActivityRollup.user_id).where(ActivityRollup.day == day),
+        ).subquery()
+        users = db.session.execute(db.select(db.func.count()).select_from(active)).scalar()
+        if users or mark:
+            upsert(DailyActiveUsers, {"day": day, "users": users}, index_elements=["day"], replace=["users"])
+        day += timedelta(days=1)
+        days += 1
+    _set_watermark("dau", now)
+    db.session.commit()
+    return days
+
+
+def refresh_analytics(now=None):
+    now = now or datetime.utcnow()
+    return refresh_problem_summary(now), refresh_daily_active_users(now)
+
+
+SORTS = {
+    "hardest": (ProblemSummary.solve_rate.asc(), ProblemSummary.started.desc()),
+    "popular": (ProblemSummary.started.desc(),),
+    "slowest": (ProblemSummary.median_solve_sec.desc().nulls_last(),),
+    "abandoned": (ProblemSummary.abandoned.desc(),),
+}
+
+
+def dashboard(sort="hardest", limit=50, days=30):
+    problems = db.session.execute(
+        db.select(ProblemSummary).order_by(*SORTS.get(sort, SORTS["hardest"]), ProblemSummary.problem_id).limit(limit)
+    ).scalars().all()
+    totals = db.session.execute(
+        db.select(
+            db.func.coalesce(db.func.sum(ProblemSummary.started), 0),
+            db.func.coalesce(db.func.sum(ProblemSummary.solved), 0),
+            db.func.coalesce(db.func.sum(ProblemSummary.abandoned), 0),
+        )
+    ).one()
+    dau = db.session.execute(
+        db.select(DailyActiveUsers).order_by(DailyActiveUsers.day.desc()).limit(days)
+    ).scalars().all()
+    marks = dict(db.session.execute(db.select(AnalyticsWatermark.name, AnalyticsWatermark.value)).all())
+    return {"problems": problems, "totals": totals, "dau": dau[::-1], "refreshed": marks}
@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional; gzip copies are always built
+    brotli = None
+
+
+# `flask build-assets` copies every css/js file under static/ to
+# static/dist/<name>.<hash>.<ext> plus .gz/.br siblings and a manifest.
+# url_for("static", ...) then points at the fingerprinted copy, which is
+# served with a one-year immutable Cache-Control.
+
+DIST = "dist"
+EXTENSIONS = (".css", ".js")
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def build_assets(app):
+    root = app.static_folder
+    dist = os.path.join(root, DIST)
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if os.path.join(folder, d) != dist]
+        for name in sorted(files):
+            if not name.endswith(EXTENSIONS):
+                continue
+            path = os.path.join(folder, name)
+            source = os.path.relpath(path, root).replace(os.sep, "/")
+            with open(path, "rb") as handle:
+                data = handle.read()
+            stem, ext = os.path.splitext(source)
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            target = f"{DIST}/{stem}.{digest}{ext}"
+            out = os.path.join(root, target)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            with open(out, "wb") as handle:
+                handle.write(data)
+            with open(out + ".gz", "wb") as handle:
+                handle.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(out + ".br", "wb") as handle:
+                    handle.write(brotli.compress(data, quality=11))
+            manifest[source] = target
+    with open(os.path.join(dist, "manifest.json"), "w") as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(app):
+    try:
+        with open(os.path.join(app.static_folder, DIST, "manifest.json")) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_app(app):
+    app.extensions["asset_manifest"] = load_manifest(app)
+    serve_static = app.view_functions["static"]
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            target = app.extensions["asset_manifest"].get(values["filename"])
+            if target:
+                values["filename"] = target
+
+    def static(filename):
+        if not filename.startswith(DIST + "/"):
+            return serve_static(filename=filename)
+        response = None
+        for encoding, suffix in _ENCODINGS:
+            if encoding in request.accept_encodings and os.path.isfile(
+                os.path.join(app.static_folder, filename + suffix)
+            ):
+                response = send_from_directory(app.static_folder, filename + suffix, max_age=31536000)
+                response.mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                response.content_encoding = encoding
+                break
+        if response is None:
+            response = send_from_directory(app.static_folder, filename, max_age=31536000)
+        response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions["static"] = static
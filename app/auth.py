@@ -3,8 +3,11 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_user, logout_user, current_user
 from .extensions import db, login_manager
 from .forms import LoginForm, RegisterForm
-from .models import User, UserStats, AppSetting, ActivityLog
-from .utils import update_streak
+from .identity import identity_cache
+from .models import User, UserStats, AppSetting
+from .passwords import HashingBusy, needs_rehash
+from . import ratelimit
+from .tasks import defer_activity
 
 
 auth_bp = Blueprint("auth", __name__)
@@ -12,7 +15,7 @@ auth_bp = Blueprint("auth", __name__)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return identity_cache.load(int(user_id))
 
 
 def _registration_open() -> bool:
@@ -24,14 +27,43 @@ def _registration_open() -> bool:
     return value.lower() == "true"
 
 
+def _throttle(*limits):
+    # limits are (name, key) pairs; returns seconds to wait, or 0
+    return max(ratelimit.check(name, key) for name, key in limits)
+
+
+def _too_many(template, form, wait):
+    flash(f"Too many attempts. Try again in {int(wait) + 1} seconds.", "error")
+    return render_template(template, form=form), 429, {"Retry-After": str(int(wait) + 1)}
+
+
+def _busy(template, form):
+    flash("The server is busy. Please try again in a moment.", "error")
+    return render_template(template, form=form), 503, {"Retry-After": "2"}
+
+
 @auth_bp.route("/login", methods=["GET", "POST"])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for("main.dashboard"))
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data.lower()).first()
-        if user and user.check_password(form.password.data):
+        email = form.email.data.lower()
+        wait = _throttle(("login_ip", request.remote_addr), ("login_email", email))
+        if wait:
+            return _too_many("auth/login.html", form, wait)
+        user = User.query.filter_by(email=email).first()
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except HashingBusy:
+            return _busy("auth/login.html", form)
+        if valid:
+            if needs_rehash(user.password_hash):
+                try:
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                except HashingBusy:
+                    pass  # upgraded on a later login
             login_user(user)
             flash("Welcome back.", "success")
             return redirect(url_for("main.dashboard"))
@@ -47,6 +79,9 @@ def register():
         return render_template("auth/register_closed.html"), 403
     form = RegisterForm()
     if form.validate_on_submit():
+        wait = _throttle(("register_ip", request.remote_addr))
+        if wait:
+            return _too_many("auth/register.html", form, wait)
         invite = current_app.config.get("INVITE_CODE", "")
         if not invite or form.invite_code.data != invite:
             flash("Invalid invite code.", "error")
@@ -56,22 +91,28 @@ def register():
             return render_template("auth/register.html", form=form)
 
         first_user = User.query.count() == 0
-        user = User(email=form.email.data.lower(), is_admin=first_user)
-        user.set_password(form.password.data)
+        user = User(
+            email=form.email.data.lower(),
+            display_name=(form.display_name.data or "").strip() or None,
+            is_admin=first_user,
+        )
+        try:
+            user.set_password(form.password.data)
+        except HashingBusy:
+            return _busy("auth/register.html", form)
         db.session.add(user)
         db.session.flush()
 
-        stats = UserStats(user_id=user.id)
+        today = date.today()
+        stats = UserStats(user_id=user.id, current_streak=1, longest_streak=1, last_activity_date=today)
         db.session.add(stats)
-        db.session.add(ActivityLog(user_id=user.id, action="register", ref_type="user", ref_id=user.id))
+        defer_activity(user.id, "register", "user", user.id)
 
         if first_user:
             AppSetting.set_value("registration_open", "false")
 
         db.session.commit()
         login_user(user)
-        update_streak(user.stats, date.today())
-        db.session.commit()
         flash("Account created.", "success")
         return redirect(url_for("main.dashboard"))
 
@@ -0,0 +1,544 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import hashlib
+import json
+import random
+import secrets
+import statistics
+import time
+import tracemalloc
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from werkzeug.security import generate_password_hash
+from .extensions import db
+from .instrumentation import count_fetched_bytes
+from .models import (
+    ActivityLog, Chapter, ChapterProgress, CodeRevision, DailyTime, LeaderboardScore, Problem, ProblemTag, ProblemTest,
+    Submission, Tag, User, UserProblem, UserStats,
+)
+from .revisions import base_hash, normalize_newlines, record_revision
+from .runner import submit
+from .utils import bump_catalog_version, bump_stats, log_time_samples
+
+
+SYNTHETIC_DOMAIN = "synthetic.invalid"
+SYNTHETIC_PASSWORD = "synthetic-password"
+# Reserved for documentation (RFC 2606) but accepted by the login form
+BENCH_LOGIN_DOMAIN = "bench.example.com"
+ACTIONS = ("open_problem", "save_problem", "solve_problem", "time_log")
+MEMORY_SAMPLES = 5
+# Row bytes `flask check-query-bytes` allows per page; neither may grow with
+# the size of a user's saved code, notes or revisions
+QUERY_BYTE_BUDGETS = {"main.chapter_detail": 8192, "main.dashboard": 8192}
+
+
+def _insert(model, rows, returning=None):
+    if not rows:
+        return []
+    if returning is None:
+        db.session.execute(db.insert(model), rows)
+        return []
+    return db.session.execute(
+        db.insert(model).returning(returning, sort_by_parameter_order=True), rows
+    ).scalars().all()
+
+
+def seed_synthetic(users, chapters, problems, problems_per_user, activity_per_user, days_per_user,
+                   batch_size=1000, seed=42, progress=None):
+    rng = random.Random(seed)
+    today = date.today()
+    run = f"{int(time.time())}"
+
+    chapter_ids = _insert(Chapter, [
+        {"title": f"Synthetic {run}-{i}", "slug": f"synthetic-{run}-{i}", "position": 100 + i}
+        for i in range(chapters)
+    ], Chapter.id)
+    tag_ids = _insert(Tag, [{"name": f"syn-{run}-{i}"} for i in range(30)], Tag.id)
+    problem_ids = []
+    for start in range(0, problems, batch_size):
+        rows = [
+            {
+                "chapter_id": chapter_ids[i % len(chapter_ids)],
+                "title": f"Problem {i}",
+                "difficulty": rng.choice(("easy", "medium", "hard")),
+                "points": rng.choice((5, 10, 20, 40)),
+                "prompt": "Synthetic prompt. " * rng.randint(5, 60),
+            }
+            for i in range(start, min(start + batch_size, problems))
+        ]
+        ids = _insert(Problem, rows, Problem.id)
+        _insert(ProblemTag, [
+            {"problem_id": pid, "tag_id": tag_id}
+            for pid in ids
+            for tag_id in rng.sample(tag_ids, rng.randint(1, 3))
+        ])
+        problem_ids.extend(ids)
+    bump_catalog_version()
+    db.session.commit()
+
+    password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+    created = 0
+    for start in range(0, users, batch_size):
+        count = min(batch_size, users - start)
+        user_ids = _insert(User, [
+            {"email": f"user-{run}-{start + i}@{SYNTHETIC_DOMAIN}", "password_hash": password_hash, "is_admin": False}
+            for i in range(count)
+        ], User.id)
+        _insert(UserStats, [{"user_id": uid} for uid in user_ids])
+
+        user_problems, activity, daily = [], [], []
+        for uid in user_ids:
+            for pid in rng.sample(problem_ids, min(problems_per_user, len(problem_ids))):
+                status = rng.choice(("attempted", "solved", "solved"))
+                saved = datetime.utcnow() - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86400))
+                user_problems.append({
+                    "user_id": uid,
+                    "problem_id": pid,
+                    "status": status,
+                    "code": "def solve():\n    return 42\n" * rng.randint(1, 40),
+                    "notes": "",
+                    "attempts": rng.randint(1, 6),
+                    "time_spent_sec": rng.randint(60, 7200),
+                    "last_saved_at": saved,
+                    "solved_at": saved if status == "solved" else None,
+                    "updated_at": saved,
+                })
+            for _ in range(activity_per_user):
+                activity.append({
+                    "user_id": uid,
+                    "action": rng.choice(ACTIONS),
+                    "ref_type": "problem",
+                    "ref_id": rng.choice(problem_ids),
+                    "created_at": datetime.utcnow() - timedelta(seconds=rng.randint(0, 365 * 86400)),
+                    "meta_json": "{}",
+                })
+            for offset in rng.sample(range(365), min(days_per_user, 365)):
+                daily.append({"user_id": uid, "day": today - timedelta(days=offset), "seconds": rng.randint(60, 10800)})
+
+        for model, rows in ((UserProblem, user_problems), (ActivityLog, activity), (DailyTime, daily)):
+            for chunk in range(0, len(rows), 10000):
+                _insert(model, rows[chunk:chunk + 10000])
+        db.session.commit()
+        created += count
+        if progress:
+            progress(created)
+    return created
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+def _routes(app, sample):
+    # (name, method, url factory, request kwargs factory); "auth_" and
+    # "health_" routes run logged out on a fresh client, "admin_" ones as an
+    # admin and "own_" ones as the login user on the problem set up for it.
+    # Left out: POSTs to /register, /admin/chapters/new and
+    # /admin/problems/new, which would add an account, chapter or problem to
+    # the catalog on every iteration (their forms are driven instead).
+    problem_ids, chapter_slugs = sample["problem_ids"], sample["chapter_slugs"]
+    own = sample["own"]
+    own_url = f"/problems/{own['problem_id']}"
+    routes = [
+        ("index", "GET", lambda r: "/", None),
+        ("dashboard", "GET", lambda r: "/dashboard", None),
+        ("chapters", "GET", lambda r: "/chapters", None),
+        ("chapter_detail", "GET", lambda r: f"/chapters/{r.choice(chapter_slugs)}", None),
+        ("problem_detail", "GET", lambda r: f"/problems/{r.choice(problem_ids)}", None),
+        ("save_problem", "POST", lambda r: f"/problems/{r.choice(problem_ids)}/save",
+         lambda r: {"data": {"code": "print(%d)" % r.randint(0, 10**6), "notes": ""}}),
+        ("time", "POST", lambda r: f"/problems/{r.choice(problem_ids)}/time", lambda r: {"json": {"seconds": 60}}),
+        ("heartbeat", "POST", lambda r: "/time",
+         lambda r: {"json": {"samples": [{"problem_id": r.choice(problem_ids), "seconds": 60} for _ in range(3)]}}),
+        ("stats", "GET", lambda r: "/stats", None),
+        ("stats_activity", "GET", lambda r: "/stats/activity.json", None),
+        ("leaderboard", "GET", lambda r: "/leaderboard", None),
+        ("next", "GET", lambda r: "/next", None),
+        ("recommendations", "GET", lambda r: "/recommendations.json", None),
+        ("export", "GET", lambda r: "/export/problems.ndjson", None),
+        ("own_autosave", "POST", lambda r: f"{own_url}/autosave", lambda r: _autosave_body(app, own, r)),
+        ("own_revisions", "GET", lambda r: f"{own_url}/revisions", None),
+        ("own_revision", "GET", lambda r: f"{own_url}/revisions/1", None),
+        ("own_restore", "POST", lambda r: f"{own_url}/revisions/{r.randint(1, 3)}/restore", None),
+        ("own_run", "POST", lambda r: f"{own_url}/run", lambda r: {"json": {"code": "print(%d)" % r.randint(0, 10**6)}}),
+        ("own_submission", "GET", lambda r: f"{own_url}/submissions/{own['submission_id']}", None),
+        ("auth_login", "POST", lambda r: "/login",
+         lambda r: {"data": {"email": sample["login"][0], "password": sample["login"][1]}}),
+        ("auth_register_form", "GET", lambda r: "/register", None),
+        ("auth_logout", "GET", lambda r: "/logout", None),
+        ("health_healthz", "GET", lambda r: "/healthz", None),
+        ("health_readyz", "GET", lambda r: "/readyz", None),
+        ("admin_index", "GET", lambda r: "/admin/", None),
+        ("admin_new_chapter_form", "GET", lambda r: "/admin/chapters/new", None),
+        ("admin_new_problem_form", "GET", lambda r: "/admin/problems/new", None),
+        # Every problem in the payload already exists, so this exercises
+        # parsing, validation and the duplicate check without writing
+        ("admin_import", "POST", lambda r: "/admin/import",
+         lambda r: {"data": {"payload": sample["import_payload"]}}),
+        ("admin_export", "GET", lambda r: "/admin/export/problems.ndjson", None),
+        ("admin_analytics", "GET", lambda r: "/admin/analytics", None),
+    ]
+    if sample["search_terms"]:
+        routes.append(("search", "GET", lambda r: f"/search?q={r.choice(sample['search_terms'])}", None))
+        routes.append(("search_json", "GET", lambda r: f"/search.json?q={r.choice(sample['search_terms'])}", None))
+    return routes
+
+
+def _autosave_body(app, own, rng):
+    # Splices are offsets into the stored text, so each one is computed
+    # against the current row, the way the editor would
+    with app.app_context():
+        user_problem = db.session.execute(
+            db.select(UserProblem).options(db.undefer_group("content"))
+            .where(UserProblem.user_id == own["user_id"], UserProblem.problem_id == own["problem_id"])
+        ).scalar_one()
+        end = len(normalize_newlines(user_problem.code))
+        body = {
+            "version": user_problem.revision,
+            "base": base_hash(user_problem),
+            "code": [{"start": end, "end": end, "text": "# %d\n" % rng.randint(0, 10**6)}],
+            "notes": [],
+        }
+        db.session.remove()
+    return {"json": body}
+
+
+def _own_problem(user_id, problem_id):
+    # A few revisions and a submission for the "own_" routes to work on
+    user_problem = UserProblem(user_id=user_id, problem_id=problem_id, status="attempted",
+                               last_opened_at=datetime.utcnow())
+    db.session.add(user_problem)
+    db.session.flush()
+    for n in range(3):
+        record_revision(user_problem, "print(%d)\n" % n, "")
+    submission = submit(user_problem, user_problem.code)
+    db.session.commit()
+    return {"user_id": user_id, "problem_id": problem_id, "submission_id": submission.id}
+
+
+def _drive(app, rng, sample, iterations, only, queries):
+    results = {}
+    clients = {}
+    admin_id = sample["admin_id"]
+    for uid in set(sample["user_ids"] + [sample["own"]["user_id"]] + ([admin_id] if admin_id else [])):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(uid)
+            session["_fresh"] = True
+        clients[uid] = client
+
+    for name, method, url, kwargs in _routes(app, sample):
+        if only and name not in only:
+            continue
+        latencies, counts, fetched, peaks, statuses = [], [], [], [], defaultdict(int)
+        # Peak memory is sampled on a few extra runs so tracing doesn't skew latency
+        for i in range(iterations + MEMORY_SAMPLES):
+            traced = i >= iterations
+            if name.startswith(("auth_", "health_")):
+                client = app.test_client()
+                if name == "auth_logout":
+                    with client.session_transaction() as session:
+                        session["_user_id"] = str(sample["own"]["user_id"])
+                        session["_fresh"] = True
+            elif name.startswith("own_"):
+                client = clients[sample["own"]["user_id"]]
+            else:
+                uid = admin_id if name.startswith("admin") and admin_id else rng.choice(sample["user_ids"])
+                client = clients[uid]
+            target, options = url(rng), (kwargs(rng) if kwargs else {})
+            queries["n"] = queries["bytes"] = 0
+            if traced:
+                tracemalloc.start()
+            started = time.perf_counter()
+            response = client.open(target, method=method, **options)
+            response.get_data()  # streamed responses (exports) are timed to the last byte
+            elapsed = (time.perf_counter() - started) * 1000
+            response.close()
+            if traced:
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+                continue
+            latencies.append(elapsed)
+            counts.append(queries["n"])
+            fetched.append(queries["bytes"])
+            statuses[response.status_code] += 1
+        results[name] = {
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(_percentile(latencies, 95), 2),
+            "queries_avg": round(statistics.mean(counts), 2),
+            "queries_max": max(counts),
+            "bytes_avg": round(statistics.mean(fetched)),
+            "bytes_max": max(fetched),
+            "peak_kib": round(max(peaks) / 1024, 1),
+            "statuses": dict(statuses),
+        }
+    return results
+
+
+def _sample(users):
+    user_ids = db.session.execute(
+        db.select(User.id).order_by(db.func.random()).limit(users)
+    ).scalars().all()
+    titles = db.session.execute(
+        db.select(Chapter.title, Chapter.position, Problem.title)
+        .join(Problem, Problem.chapter_id == Chapter.id)
+        .order_by(Problem.id)
+        .limit(20)
+    ).all()
+    chapters = {}
+    for chapter_title, position, problem_title in titles:
+        chapters.setdefault((chapter_title, position), []).append({"title": problem_title})
+    words = {w.lower() for _, _, title in titles for w in title.split() if len(w) >= 3 and w.isalpha()}
+    return {
+        "user_ids": user_ids,
+        "admin_id": db.session.execute(db.select(User.id).where(User.is_admin.is_(True)).limit(1)).scalar(),
+        "problem_ids": db.session.execute(db.select(Problem.id)).scalars().all(),
+        "chapter_slugs": db.session.execute(db.select(Chapter.slug)).scalars().all(),
+        "search_terms": sorted(words),
+        "import_payload": json.dumps({"chapters": [
+            {"title": title, "position": position, "problems": problems}
+            for (title, position), problems in chapters.items()
+        ]}),
+    }
+
+
+def run_benchmarks(iterations=50, users=20, seed=7, only=None):
+    app = current_app._get_current_object()
+    rng = random.Random(seed)
+    sample = _sample(users)
+    if not sample["user_ids"] or not sample["problem_ids"]:
+        raise RuntimeError("Benchmarks need users and problems; run flask seed-synthetic first.")
+    # Seeded emails don't pass the login form's validator, so logins use a
+    # throwaway account with a per-run password; synthetic data has no admin,
+    # so one is added whose password nobody knows. Both are deleted afterwards.
+    run = int(time.time() * 1000)
+    password = secrets.token_urlsafe(16)
+    sample["login"] = (f"bench-{run}@{BENCH_LOGIN_DOMAIN}", password)
+    throwaway = [_throwaway_user(sample["login"][0], password)]
+    # Prefer a problem with tests, so own_run reaches the sandbox
+    own_problem = db.session.execute(db.select(ProblemTest.problem_id).limit(1)).scalar() or sample["problem_ids"][0]
+    if not sample["admin_id"]:
+        sample["admin_id"] = _throwaway_user(f"bench-admin-{run}@{BENCH_LOGIN_DOMAIN}", secrets.token_urlsafe(16),
+                                             is_admin=True)
+        throwaway.append(sample["admin_id"])
+    db.session.remove()
+
+    queries = defaultdict(int)
+
+    def count_query(*args):
+        queries["n"] += 1
+
+    def add_bytes(n):
+        queries["bytes"] += n
+
+    def count_bytes(conn, cursor, statement, parameters, context, executemany):
+        count_fetched_bytes(context, cursor, add_bytes)
+
+    engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count_query)
+        event.listen(engine, "after_cursor_execute", count_bytes)
+    app.config["WTF_CSRF_ENABLED"] = False
+    # Repeated logins from one address would otherwise just measure the 429 path
+    rate_limits, app.config["RATE_LIMITS"] = app.config.get("RATE_LIMITS"), {}
+    try:
+        sample["own"] = _own_problem(throwaway[0], own_problem)
+        db.session.remove()
+        # Requests must not share the CLI's app context (and its `g`), so the
+        # loop runs on a thread that starts without one.
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            results = pool.submit(_drive, app, rng, sample, iterations, only, queries).result()
+    finally:
+        app.config["RATE_LIMITS"] = rate_limits
+        db.session.rollback()
+        for user_id in throwaway:
+            _delete_user(user_id)
+        db.session.commit()
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", count_query)
+            event.remove(engine, "after_cursor_execute", count_bytes)
+    return {
+        "dialect": db.engine.dialect.name,
+        "iterations": iterations,
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "routes": results,
+    }
+
+
+def _throwaway_user(email, password, is_admin=False):
+    user = User(email=email, password_hash=generate_password_hash(password, current_app.config["PASSWORD_HASH_METHOD"]),
+                is_admin=is_admin)
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(UserStats(user_id=user.id))
+    db.session.commit()
+    return user.id
+
+
+def _delete_user(user_id):
+    db.session.execute(db.delete(CodeRevision).where(CodeRevision.user_problem_id.in_(
+        db.select(UserProblem.id).where(UserProblem.user_id == user_id)
+    )))
+    for model in (ActivityLog, ChapterProgress, DailyTime, Submission, UserProblem, UserStats, LeaderboardScore):
+        db.session.execute(db.delete(model).where(model.user_id == user_id))
+    db.session.execute(db.delete(User).where(User.id == user_id))
+
+
+def _seed_large_rows(run, problems, code_kib):
+    # A throwaway user and chapter whose every row that has a text or blob
+    # column carries `code_kib` of it; returns (user_id, chapter, problem_ids)
+    blob = ("x = 1  # padding\n" * (code_kib * 64))[: code_kib * 1024]
+    digest = hashlib.sha256(blob.encode("utf-8")).hexdigest()
+    user_id = _throwaway_user(f"bench-bytes-{run}@{BENCH_LOGIN_DOMAIN}", secrets.token_urlsafe(16))
+    chapter = Chapter(title=f"Bench bytes {run}", slug=f"bench-bytes-{run}", position=10**6, problem_count=problems)
+    db.session.add(chapter)
+    db.session.flush()
+    problem_ids = _insert(Problem, [
+        {"chapter_id": chapter.id, "title": f"Bench bytes {i}", "difficulty": "easy", "points": 10, "prompt": blob}
+        for i in range(problems)
+    ], returning=Problem.id)
+    now = datetime.utcnow()
+    user_problem_ids = _insert(UserProblem, [
+        {"user_id": user_id, "problem_id": problem_id, "status": "solved" if i % 2 else "attempted",
+         "code": blob, "notes": blob, "attempts": 1, "revision": 1, "content_hash": digest,
+         "last_opened_at": now, "last_saved_at": now, "updated_at": now}
+        for i, problem_id in enumerate(problem_ids)
+    ], returning=UserProblem.id)
+    _insert(CodeRevision, [
+        {"user_problem_id": up_id, "number": 1, "is_snapshot": True, "content_hash": digest,
+         "payload": blob.encode("utf-8"), "size": len(blob), "created_at": now}
+        for up_id in user_problem_ids
+    ])
+    _insert(ActivityLog, [
+        {"user_id": user_id, "action": "save_problem", "ref_type": "problem", "ref_id": problem_id,
+         "created_at": now, "meta_json": json.dumps({"code": blob})}
+        for problem_id in problem_ids
+    ])
+    db.session.add(ChapterProgress(user_id=user_id, chapter_id=chapter.id, solved=problems // 2))
+    bump_catalog_version()
+    db.session.commit()
+    return user_id, chapter, problem_ids
+
+
+def _fetch_pages(app, user_id, urls, fetched):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+    results = {}
+    for endpoint, url in urls.items():
+        client.get(url).close()  # warm the catalog cache; only per-request rows count
+        fetched["bytes"] = 0
+        response = client.get(url)
+        results[endpoint] = (response.status_code, fetched["bytes"])
+        response.close()
+    return results
+
+
+def check_query_bytes(problems=40, code_kib=64):
+    # Fetches the pages in QUERY_BYTE_BUDGETS for a user whose saved code is
+    # large and returns {endpoint: (status, bytes fetched, budget)}
+    app = current_app._get_current_object()
+    run = int(time.time() * 1000)
+    user_id, chapter, problem_ids = _seed_large_rows(run, problems, code_kib)
+    urls = {"main.chapter_detail": f"/chapters/{chapter.slug}", "main.dashboard": "/dashboard"}
+    db.session.remove()
+
+    fetched = defaultdict(int)
+
+    def add_bytes(n):
+        fetched["bytes"] += n
+
+    def count_bytes(conn, cursor, statement, parameters, context, executemany):
+        count_fetched_bytes(context, cursor, add_bytes)
+
+    engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, "after_cursor_execute", count_bytes)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            results = pool.submit(_fetch_pages, app, user_id, urls, fetched).result()
+    finally:
+        for engine in engines:
+            event.remove(engine, "after_cursor_execute", count_bytes)
+        db.session.rollback()
+        _delete_user(user_id)
+        db.session.execute(db.delete(Problem).where(Problem.id.in_(problem_ids)))
+        db.session.execute(db.delete(Chapter).where(Chapter.slug == chapter.slug))
+        bump_catalog_version()
+        db.session.commit()
+    return {endpoint: (*results[endpoint], QUERY_BYTE_BUDGETS[endpoint]) for endpoint in urls}
+
+
+def _hammer(app, user_id, problem_id, iterations):
+    # One worker thread: every iteration is its own request-sized transaction
+    retries = 0
+    with app.app_context():
+        for _ in range(iterations):
+            while True:
+                try:
+                    log_time_samples(user_id, [(problem_id, 1)], date.today())
+                    bump_stats(user_id, xp=1, progress=True)
+                    db.session.commit()
+                    break
+                except OperationalError:
+                    # SQLite "database is locked"; the increment must still land once
+                    db.session.rollback()
+                    retries += 1
+        db.session.remove()
+    return retries
+
+
+def stress_counters(threads=8, iterations=100):
+    # Concurrent time/XP increments against a throwaway user; returns
+    # {counter: (expected, actual)} so lost updates show up as mismatches.
+    app = current_app._get_current_object()
+    problem_id = db.session.execute(db.select(Problem.id).limit(1)).scalar()
+    if problem_id is None:
+        raise RuntimeError("The stress test needs at least one problem.")
+    user_id = _throwaway_user(f"stress-{int(time.time() * 1000)}@{SYNTHETIC_DOMAIN}", SYNTHETIC_PASSWORD)
+    db.session.remove()
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            retries = sum(pool.map(
+                lambda _: _hammer(app, user_id, problem_id, iterations), range(threads)
+            ))
+        total = threads * iterations
+        stats = db.session.get(UserStats, user_id)
+        actual = {
+            "xp": stats.xp,
+            "total_time_sec": stats.total_time_sec,
+            "progress_version": stats.progress_version,
+            "daily_time": db.session.execute(
+                db.select(db.func.sum(DailyTime.seconds)).where(DailyTime.user_id == user_id)
+            ).scalar(),
+            "time_spent_sec": db.session.execute(
+                db.select(UserProblem.time_spent_sec).where(UserProblem.user_id == user_id)
+            ).scalar(),
+        }
+        return {key: (total, value) for key, value in actual.items()}, retries
+    finally:
+        db.session.rollback()
+        _delete_user(user_id)
+        db.session.commit()
+
+
+def compare(current, baseline):
+    # Yields (route, metric, before, after) for metrics present in both runs
+    for route, metrics in current["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before:
+            continue
+        for metric in ("p50_ms", "p95_ms", "queries_avg", "bytes_avg", "peak_kib"):
+            if metric in before:
+                yield route, metric, before[metric], metrics[metric]
+
+
+def load_results(path):
+    with open(path) as handle:
+        return json.load(handle)
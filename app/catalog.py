@@ -0,0 +1,119 @@
+from collections import namedtuple, defaultdict
+from threading import Lock
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .extensions import db
+from .models import AppSetting, CatalogVersion, Chapter, Problem, ProblemTag, Tag
+
+
+CachedChapter = namedtuple("CachedChapter", "id title slug position problem_count")
+CachedProblem = namedtuple("CachedProblem", "id chapter_id title difficulty points tags")
+
+
+class CatalogCache:
+    # Per-worker read-through cache of chapters, problems (without prompts),
+    # tags and app settings. The catalog_version row is polled at most once
+    # per CATALOG_CACHE_TTL seconds; local writes invalidate it on commit.
+
+    def __init__(self):
+        self._lock = Lock()
+        self._data = None
+        self.version = None
+        self.updated_at = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
+            self._data = None
+
+    def _load(self):
+        chapters = [
+            CachedChapter(*row)
+            for row in db.session.execute(
+                db.select(Chapter.id, Chapter.title, Chapter.slug, Chapter.position, Chapter.problem_count)
+                .order_by(Chapter.position.asc(), Chapter.id.asc())
+            )
+        ]
+        tags = dict(db.session.execute(db.select(Tag.id, Tag.name)).all())
+        problem_tags = defaultdict(list)
+        for problem_id, tag_id in db.session.execute(
+            db.select(ProblemTag.problem_id, ProblemTag.tag_id).order_by(ProblemTag.problem_id, ProblemTag.tag_id)
+        ):
+            problem_tags[problem_id].append(tags[tag_id])
+        problems = {}
+        by_chapter = defaultdict(list)
+        for row in db.session.execute(
+            db.select(Problem.id, Problem.chapter_id, Problem.title, Problem.difficulty, Problem.points)
+            .order_by(Problem.id.asc())
+        ):
+            problem = CachedProblem(*row, tags=tuple(problem_tags[row.id]))
+            problems[problem.id] = problem
+            by_chapter[problem.chapter_id].append(problem)
+        settings = dict(db.session.execute(db.select(AppSetting.key, AppSetting.value)).all())
+        return {
+            "chapters": chapters,
+            "chapters_by_slug": {c.slug: c for c in chapters},
+            "chapters_by_id": {c.id: c for c in chapters},
+            "problems": problems,
+            "by_chapter": dict(by_chapter),
+            "tags": tags,
+            "settings": settings,
+        }
+
+    def _current(self):
+        ttl = current_app.config.get("CATALOG_CACHE_TTL", 5)
+        now = time.monotonic()
+        data = self._data
+        if data is not None and now - self._checked_at < ttl:
+            return data
+        with self._lock:
+            if self._data is not None and now - self._checked_at < ttl:
+                return self._data
+            row = db.session.execute(
+                db.select(CatalogVersion.version, CatalogVersion.updated_at).where(CatalogVersion.id == 1)
+            ).first()
+            version, updated_at = row if row else (0, None)
+            if self._data is None or version != self.version:
+                self._data = self._load()
+                self.version = version
+                self.updated_at = updated_at
+            self._checked_at = now
+            return self._data
+
+    def chapters(self):
+        return self._current()["chapters"]
+
+    def chapter(self, chapter_id):
+        return self._current()["chapters_by_id"].get(chapter_id)
+
+    def chapter_by_slug(self, slug):
+        return self._current()["chapters_by_slug"].get(slug)
+
+    def problem(self, problem_id):
+        return self._current()["problems"].get(problem_id)
+
+    def chapter_problems(self, chapter_id):
+        return self._current()["by_chapter"].get(chapter_id, [])
+
+    def tags(self):
+        return self._current()["tags"]
+
+    def setting(self, key, default=None):
+        return self._current()["settings"].get(key, default)
+
+
+catalog = CatalogCache()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("catalog_dirty", False):
+        catalog.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rollback(session):
+    session.info.pop("catalog_dirty", None)
@@ -1,8 +1,22 @@
+import json
+import os
+import signal
+import time
+from flask import current_app
 from flask.cli import with_appcontext
 import click
+from .activity import rollup_activity
+from .analytics import refresh_analytics
+from .jobs import run_worker
+from .importer import ProblemImporter, iter_json, iter_ndjson
+from . import bench, leaderboard
+from .assets import build_assets
+from . import export
+from .recompute import recompute_stats
+from .search import rebuild_index
 from .extensions import db
-from .models import Chapter, Problem, Tag
-from .utils import slugify
+from .models import Chapter, ChapterProgress, Problem, ProblemTest, Tag, UserProblem
+from .utils import slugify, bump_catalog_version
 
 
 @click.command("seed")
@@ -21,9 +35,337 @@ def seed():
     for idx, title in enumerate(chapters, start=1):
         if not Chapter.query.filter_by(slug=slugify(title)).first():
             db.session.add(Chapter(title=title, slug=slugify(title), position=idx))
+    bump_catalog_version()
     db.session.commit()
     click.echo("Seeded chapters.")
 
 
+@click.command("import-problems")
+@click.argument("source", type=click.File("r", encoding="utf-8"))
+@click.option("--format", "fmt", type=click.Choice(["auto", "json", "ndjson"]), default="auto", show_default=True)
+@click.option("--batch-size", default=500, show_default=True)
+@with_appcontext
+def import_problems(source, fmt, batch_size):
+    if fmt == "auto":
+        fmt = "ndjson" if source.name.endswith((".ndjson", ".jsonl")) else "json"
+    started = time.monotonic()
+
+    def report(created, skipped):
+        elapsed = time.monotonic() - started
+        rate = created / elapsed if elapsed else 0
+        click.echo(f"{created} imported, {skipped} skipped ({rate:.0f} problems/s)")
+
+    items = iter_ndjson(source) if fmt == "ndjson" else iter_json(source)
+    importer = ProblemImporter(batch_size=batch_size, progress=report)
+    try:
+        created, skipped = importer.run(items)
+    except ValueError as exc:
+        db.session.rollback()
+        raise click.ClickException(
+            f"Import stopped: {exc}. {importer.created} problems were imported before this; "
+            "fix the file and re-run it to import the rest."
+        )
+    for number, title, reason in importer.invalid:
+        click.echo(f"Skipped record {number} {title!r}: {reason}", err=True)
+    click.echo(
+        f"Done: {created} imported, {skipped} already present, {len(importer.invalid)} invalid "
+        f"in {time.monotonic() - started:.1f}s."
+    )
+
+
+@click.command("rebuild-progress")
+@with_appcontext
+def rebuild_progress():
+    problem_counts = (
+        db.select(db.func.count(Problem.id))
+        .where(Problem.chapter_id == Chapter.id)
+        .scalar_subquery()
+    )
+    db.session.execute(db.update(Chapter).values(problem_count=problem_counts))
+    bump_catalog_version()
+
+    solved = (
+        db.select(UserProblem.user_id, Problem.chapter_id, db.func.count())
+        .join(Problem, Problem.id == UserProblem.problem_id)
+        .where(UserProblem.status == "solved")
+        .group_by(UserProblem.user_id, Problem.chapter_id)
+    )
+    db.session.execute(db.delete(ChapterProgress))
+    result = db.session.execute(
+        db.insert(ChapterProgress).from_select(["user_id", "chapter_id", "solved"], solved)
+    )
+    db.session.commit()
+    click.echo(f"Rebuilt progress ({result.rowcount} rows).")
+
+
+@click.command("rollup-activity")
+@click.option("--batch-size", default=5000, show_default=True)
+@with_appcontext
+def rollup_activity_command(batch_size):
+    config = current_app.config
+    compacted, purged = rollup_activity(
+        config["ACTIVITY_RETENTION_DAYS"],
+        config["ACTIVITY_TIME_LOG_RETENTION_DAYS"],
+        config["ACTIVITY_ROLLUP_RETENTION_DAYS"],
+        batch_size=batch_size,
+    )
+    weeks = config["LEADERBOARD_WEEKS_TO_KEEP"]
+    boards = leaderboard.purge_weekly(weeks) if weeks > 0 else 0
+    db.session.commit()
+    click.echo(f"Compacted {compacted} activity rows, purged {purged} rollup rows and {boards} weekly scores.")
+
+
+@click.command("rebuild-leaderboard")
+@click.option("--weeks", default=8, show_default=True, help="Weekly boards to rebuild.")
+@with_appcontext
+def rebuild_leaderboard(weeks):
+    leaderboard.rebuild(weeks_to_keep=weeks)
+    click.echo("Rebuilt leaderboards.")
+
+
+@click.command("recompute-stats")
+@click.option("--chunk-size", default=1000, show_default=True)
+@click.option("--dry-run", is_flag=True, help="Report differences without writing them.")
+@click.option("--show", default=20, show_default=True, help="Number of per-user diffs to print.")
+@with_appcontext
+def recompute_stats_command(chunk_size, dry_run, show):
+    started = time.monotonic()
+    shown = []
+
+    def report(user_id, changed):
+        if len(shown) < show:
+            shown.append(user_id)
+            diff = ", ".join(f"{field}: {old} -> {new}" for field, (old, new) in changed.items())
+            click.echo(f"user {user_id}: {diff}")
+
+    changed = recompute_stats(chunk_size=chunk_size, dry_run=dry_run, report=report)
+    summary = ", ".join(f"{field}={count}" for field, count in sorted(changed.items())) or "no changes"
+    verb = "Would update" if dry_run else "Updated"
+    click.echo(f"{verb}: {summary} ({time.monotonic() - started:.1f}s).")
+
+
+@click.command("seed-synthetic")
+@click.option("--users", default=1000, show_default=True)
+@click.option("--chapters", default=20, show_default=True)
+@click.option("--problems", default=400, show_default=True)
+@click.option("--problems-per-user", default=40, show_default=True)
+@click.option("--activity-per-user", default=100, show_default=True)
+@click.option("--days-per-user", default=60, show_default=True)
+@click.option("--batch-size", default=1000, show_default=True)
+@click.option("--seed", default=42, show_default=True)
+@click.pass_context
+@with_appcontext
+def seed_synthetic(ctx, users, chapters, problems, problems_per_user, activity_per_user, days_per_user, batch_size, seed):
+    started = time.monotonic()
+
+    def report(created):
+        elapsed = time.monotonic() - started
+        click.echo(f"{created}/{users} users ({created / elapsed:.0f} users/s)")
+
+    bench.seed_synthetic(
+        users, chapters, problems, problems_per_user, activity_per_user, days_per_user,
+        batch_size=batch_size, seed=seed, progress=report,
+    )
+    click.echo("Rebuilding derived tables...")
+    ctx.invoke(rebuild_progress)
+    recompute_stats()
+    leaderboard.rebuild()
+    rebuild_index()
+    click.echo(f"Seeded synthetic data in {time.monotonic() - started:.1f}s.")
+
+
+@click.command("bench")
+@click.option("--iterations", default=50, show_default=True)
+@click.option("--users", default=20, show_default=True, help="Distinct users to sample requests from.")
+@click.option("--route", "routes", multiple=True, help="Only run these routes.")
+@click.option("--output", type=click.Path(dir_okay=False), help="Write JSON results to this file.")
+@click.option("--compare", "baseline", type=click.Path(exists=True, dir_okay=False), help="Previous JSON results.")
+@with_appcontext
+def bench_command(iterations, users, routes, output, baseline):
+    try:
+        results = bench.run_benchmarks(iterations=iterations, users=users, only=set(routes))
+    except RuntimeError as exc:
+        raise click.ClickException(str(exc))
+    for name, metrics in results["routes"].items():
+        click.echo(
+            f"{name:22} p50 {metrics['p50_ms']:8.2f}ms  p95 {metrics['p95_ms']:8.2f}ms  "
+            f"queries {metrics['queries_avg']:5.1f}  bytes {metrics['bytes_avg']:8}  peak {metrics['peak_kib']:8.1f}KiB  {metrics['statuses']}"
+        )
+    if baseline:
+        for route, metric, before, after in bench.compare(results, bench.load_results(baseline)):
+            change = ((after - before) / before * 100) if before else 0
+            click.echo(f"{route:22} {metric:12} {before:10} -> {after:10} ({change:+.1f}%)")
+    if output:
+        with open(output, "w") as handle:
+            json.dump(results, handle, indent=2)
+        click.echo(f"Wrote {output}.")
+
+
+@click.command("check-query-bytes")
+@click.option("--problems", default=40, show_default=True)
+@click.option("--code-kib", default=64, show_default=True, help="Saved code, notes and revision size per problem.")
+@with_appcontext
+def check_query_bytes_command(problems, code_kib):
+    failed = False
+    for endpoint, (status, fetched, budget) in bench.check_query_bytes(problems=problems, code_kib=code_kib).items():
+        ok = status == 200 and fetched <= budget
+        failed = failed or not ok
+        click.echo(f"{endpoint:22} status {status}  bytes {fetched:8}  budget {budget:8}  {'ok' if ok else 'OVER'}")
+    if failed:
+        raise click.ClickException("Pages fetched more row data than their pinned budget.")
+
+
+@click.command("search-index")
+@with_appcontext
+def search_index():
+    started = time.monotonic()
+    rebuild_index()
+    click.echo(f"Rebuilt problem search index in {time.monotonic() - started:.1f}s.")
+
+
+@click.command("build-assets")
+@with_appcontext
+def build_assets_command():
+    manifest = build_assets(current_app)
+    click.echo(f"Built {len(manifest)} fingerprinted assets.")
+
+
+@click.command("export")
+@click.argument("dataset", type=click.Choice(sorted(export.DATASETS)))
+@click.option("--format", "fmt", type=click.Choice(sorted(export.FORMATS)), default="ndjson", show_default=True)
+@click.option("--output", type=click.Path(dir_okay=False), default="-", help="File to write; '-' is stdout.")
+@click.option("--user-id", type=int, help="Only this user's rows.")
+@click.option("--after", type=int, default=0, help="Start after this row id.")
+@click.option("--resume", is_flag=True, help="Continue a partial --output file from its .progress marker.")
+@with_appcontext
+def export_command(dataset, fmt, output, user_id, after, resume):
+    if output == "-":
+        for chunk in export.stream(dataset, fmt, user_id=user_id, after=after):
+            click.echo(chunk, nl=False)
+        return
+
+    # The .progress marker records the last id and byte offset flushed to
+    # disk, so a resumed export drops any half-written tail and continues.
+    marker = output + ".progress"
+    mode = "w"
+    if resume:
+        try:
+            with open(marker) as handle:
+                state = json.load(handle)
+            after, mode = state["after"], "r+"
+        except (OSError, ValueError, KeyError):
+            raise click.ClickException(f"No resumable export at {output}.")
+    started, count = time.monotonic(), 0
+    with open(output, mode, encoding="utf-8", newline="") as handle:
+        if mode == "r+":
+            handle.seek(state["offset"])
+            handle.truncate()
+        elif fmt == "csv" and not after:
+            handle.write(export.header(dataset, fmt))
+
+        def checkpoint(last_id):
+            handle.flush()
+            with open(marker, "w") as progress:
+                json.dump({"after": last_id, "offset": handle.tell()}, progress)
+
+        checkpoint(after)
+        for row in export.iter_rows(dataset, user_id=user_id, after=after):
+            handle.write(export.encode(row, fmt))
+            count += 1
+            if count % export.CHUNK_SIZE == 0:
+                checkpoint(row.id)
+                click.echo(f"{count} rows (last id {row.id})", err=True)
+    os.remove(marker)
+    click.echo(f"Exported {count} {dataset} rows to {output} in {time.monotonic() - started:.1f}s.", err=True)
+
+
+@click.command("refresh-analytics")
+@with_appcontext
+def refresh_analytics_command():
+    started = time.monotonic()
+    problems, days = refresh_analytics()
+    click.echo(f"Refreshed {problems} problem summaries and {days} days of active users in {time.monotonic() - started:.1f}s.")
+
+
+@click.command("stress-counters")
+@click.option("--threads", default=8, show_default=True)
+@click.option("--iterations", default=100, show_default=True, help="Increments per thread.")
+@with_appcontext
+def stress_counters_command(threads, iterations):
+    try:
+        results, retries = bench.stress_counters(threads=threads, iterations=iterations)
+    except RuntimeError as exc:
+        raise click.ClickException(str(exc))
+    lost = False
+    for counter, (expected, actual) in results.items():
+        click.echo(f"{counter:18} expected {expected:8} got {actual}")
+        lost = lost or actual != expected
+    click.echo(f"{retries} lock retries.")
+    if lost:
+        raise click.ClickException("Lost updates detected.")
+
+
+@click.command("worker")
+@click.option("--concurrency", default=4, show_default=True, help="Handler threads.")
+@click.option("--batch-size", default=100, show_default=True, help="Jobs claimed per poll.")
+@click.option("--poll-interval", default=1.0, show_default=True, help="Seconds to sleep when the queue is drained.")
+@click.option("--once", is_flag=True, help="Exit once no jobs are ready.")
+@with_appcontext
+def worker(concurrency, batch_size, poll_interval, once):
+    stopping = []
+    # Finish the batch in hand on SIGTERM/SIGINT, then exit
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.append(True))
+    click.echo(f"Worker started with {concurrency} threads.")
+    processed = run_worker(concurrency, batch_size, poll_interval, once, should_stop=lambda: bool(stopping))
+    click.echo(f"Worker stopped after {processed} jobs.")
+
+
+@click.command("set-tests")
+@click.argument("problem_id", type=int)
+@click.argument("source", type=click.File("r", encoding="utf-8"))
+@with_appcontext
+def set_tests(problem_id, source):
+    # SOURCE is a JSON list of {"input", "expected", "hidden"}; replaces existing tests
+    problem = db.session.get(Problem, problem_id)
+    if problem is None:
+        raise click.ClickException(f"No problem {problem_id}.")
+    try:
+        tests = [
+            {
+                "problem_id": problem_id,
+                "position": position,
+                "input": t.get("input", ""),
+                "expected": t["expected"],
+                "is_hidden": bool(t.get("hidden", False)),
+            }
+            for position, t in enumerate(json.load(source))
+        ]
+    except (ValueError, KeyError, AttributeError, TypeError) as exc:
+        raise click.ClickException(f"Invalid tests file: {exc}")
+    db.session.execute(db.delete(ProblemTest).where(ProblemTest.problem_id == problem_id))
+    if tests:
+        db.session.execute(db.insert(ProblemTest), tests)
+    problem.tests_version = (problem.tests_version or 0) + 1
+    bump_catalog_version()
+    db.session.commit()
+    click.echo(f"Problem {problem_id} now has {len(tests)} tests (version {problem.tests_version}).")
+
+
 def register_cli(app):
     app.cli.add_command(seed)
+    app.cli.add_command(import_problems)
+    app.cli.add_command(rebuild_progress)
+    app.cli.add_command(rollup_activity_command)
+    app.cli.add_command(rebuild_leaderboard)
+    app.cli.add_command(recompute_stats_command)
+    app.cli.add_command(seed_synthetic)
+    app.cli.add_command(search_index)
+    app.cli.add_command(bench_command)
+    app.cli.add_command(check_query_bytes_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(refresh_analytics_command)
+    app.cli.add_command(stress_counters_command)
+    app.cli.add_command(worker)
+    app.cli.add_command(set_tests)
@@ -9,22 +9,116 @@ def _normalize_db_url(url: str) -> str:
     return url
 
 
+def _engine_options(url: str) -> dict:
+    # Every gunicorn thread may hold one connection; the pool is per worker
+    # process, so workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) must stay under
+    # the server's connection limit (see gunicorn.conf.py).
+    options = {
+        "pool_pre_ping": True,
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "300")),
+    }
+    if url and url.startswith("postgresql"):
+        options.update(
+            pool_size=int(os.getenv("DB_POOL_SIZE", os.getenv("WEB_THREADS", "4"))),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "2")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            connect_args={"connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "5"))},
+        )
+    return options
+
+
+def _replica_binds(urls: str) -> dict:
+    # DATABASE_REPLICA_URLS is a comma-separated list of read replicas
+    return {
+        f"replica_{i}": _normalize_db_url(url.strip())
+        for i, url in enumerate(u for u in urls.split(",") if u.strip())
+    }
+
+
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-change-me")
     SQLALCHEMY_DATABASE_URI = _normalize_db_url(os.getenv("DATABASE_URL"))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_BINDS = _replica_binds(os.getenv("DATABASE_REPLICA_URLS", ""))
+    # After a write, this browser session reads from the primary for this long
+    REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+    # Seconds between health probes of each replica
+    REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "10"))
     INVITE_CODE = os.getenv("INVITE_CODE", "")
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = "Lax"
     REMEMBER_COOKIE_HTTPONLY = True
     WTF_CSRF_TIME_LIMIT = None
+    # Seconds between catalog_version checks in each worker
+    CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "5"))
+    # Seconds a worker may reuse a loaded user + stats row; 0 disables the cache
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "0"))
+    # Per-request SQL instrumentation (Server-Timing, slow log, query/byte budgets)
+    SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "").lower() in ("1", "true", "yes")
+    SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "500"))
+    SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "5"))
+    SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "0"))
+    # {"main.dashboard": 4, ...}; overrides SQL_QUERY_BUDGET per endpoint
+    SQL_QUERY_BUDGETS = {}
+    # {"main.chapter_detail": 8192, ...}; bytes of row data a request may fetch
+    SQL_BYTE_BUDGETS = {}
+    # Raise QueryBudgetExceeded instead of logging, so tests fail loudly
+    SQL_QUERY_BUDGET_STRICT = False
+    # Raw activity_log rows older than this are compacted into activity_rollup
+    ACTIVITY_RETENTION_DAYS = int(os.getenv("ACTIVITY_RETENTION_DAYS", "90"))
+    ACTIVITY_TIME_LOG_RETENTION_DAYS = int(os.getenv("ACTIVITY_TIME_LOG_RETENTION_DAYS", "2"))
+    # 0 keeps rollup rows forever
+    ACTIVITY_ROLLUP_RETENTION_DAYS = int(os.getenv("ACTIVITY_ROLLUP_RETENTION_DAYS", "0"))
+    # Autosaves this soon after the autosave revision they follow replace it
+    AUTOSAVE_COALESCE_SECONDS = int(os.getenv("AUTOSAVE_COALESCE_SECONDS", "600"))
+    # Weekly leaderboards kept, including the current week; 0 keeps them all
+    LEADERBOARD_WEEKS_TO_KEEP = int(os.getenv("LEADERBOARD_WEEKS_TO_KEEP", "8"))
+    # Unsolved progress untouched for this long counts as abandoned
+    ANALYTICS_ABANDON_DAYS = int(os.getenv("ANALYTICS_ABANDON_DAYS", "14"))
+    # Run deferred jobs inside the request instead of queueing them for `flask worker`
+    JOBS_INLINE = os.getenv("JOBS_INLINE", "").lower() in ("1", "true", "yes")
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+    JOB_BACKOFF_SECONDS = float(os.getenv("JOB_BACKOFF_SECONDS", "5"))
+    # Running jobs whose worker vanished are reclaimed after this long
+    JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+    # werkzeug hash method; stored hashes with other parameters are upgraded on login
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    # Hashing processes per web worker (0 hashes on the request thread) and
+    # how many more hashes may wait before requests get a 503
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "1"))
+    PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "8"))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+    # name: (burst, seconds to refill the burst), per web worker
+    RATE_LIMITS = {
+        "login_ip": (int(os.getenv("LOGIN_RATE_PER_IP", "20")), 60),
+        "login_email": (int(os.getenv("LOGIN_RATE_PER_EMAIL", "5")), 60),
+        "register_ip": (int(os.getenv("REGISTER_RATE_PER_IP", "5")), 600),
+        "run_user": (int(os.getenv("RUN_RATE_PER_USER", "10")), 60),
+    }
+    # Code runner limits (per submission) and pre-warmed interpreters per process
+    SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "2"))
+    SANDBOX_TIME_LIMIT = float(os.getenv("SANDBOX_TIME_LIMIT", "5"))
+    SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "4"))
+    SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "256"))
+    SANDBOX_MAX_OUTPUT = int(os.getenv("SANDBOX_MAX_OUTPUT", "65536"))
+    # Dedicated unprivileged account for submitted code, e.g.
+    # `useradd --system --no-create-home --shell /usr/sbin/nologin sandbox`
+    SANDBOX_USER = os.getenv("SANDBOX_USER", "sandbox")
+    SANDBOX_GROUP = os.getenv("SANDBOX_GROUP", "")  # defaults to the user's primary group
+    # Local development only: run code as the worker's user, with network access
+    SANDBOX_ALLOW_UNISOLATED = os.getenv("SANDBOX_ALLOW_UNISOLATED", "").lower() in ("1", "true", "yes")
+    # Reverse proxies in front of the app, so request.remote_addr is the client
+    PROXY_FIX_HOPS = int(os.getenv("PROXY_FIX_HOPS", "0"))
 
 
 class DevConfig(Config):
     DEBUG = True
+    JOBS_INLINE = os.getenv("JOBS_INLINE", "true").lower() in ("1", "true", "yes")
 
 
 class ProdConfig(Config):
     DEBUG = False
     SESSION_COOKIE_SECURE = True
     REMEMBER_COOKIE_SECURE = True
+    PROXY_FIX_HOPS = int(os.getenv("PROXY_FIX_HOPS", "1"))
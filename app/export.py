@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+from flask import Response, abort, request, stream_with_context
+from .extensions import db
+from .models import ActivityLog, DailyTime, UserProblem
+
+
+# Exports are read in id order, one keyset chunk per short-lived connection,
+# so memory stays at one chunk and no transaction is held open between
+# chunks. Every row carries its id; pass the last one back as `after` to
+# resume an interrupted export.
+
+CHUNK_SIZE = 2000
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+DATASETS = {
+    "problems": (UserProblem, (
+        "id", "user_id", "problem_id", "status", "attempts", "time_spent_sec", "revision",
+        "last_opened_at", "last_saved_at", "solved_at", "updated_at", "code", "notes",
+    )),
+    "activity": (ActivityLog, ("id", "user_id", "action", "ref_type", "ref_id", "created_at", "meta_json")),
+    "time": (DailyTime, ("id", "user_id", "day", "seconds")),
+}
+
+
+def iter_rows(dataset, user_id=None, after=0, chunk_size=CHUNK_SIZE):
+    model, fields = DATASETS[dataset]
+    columns = [getattr(model, name) for name in fields]
+    while True:
+        stmt = db.select(*columns).where(model.id > after).order_by(model.id.asc()).limit(chunk_size)
+        if user_id is not None:
+            stmt = stmt.where(model.user_id == user_id)
+        with db.engine.connect() as conn:
+            rows = conn.execute(stmt.execution_options(yield_per=chunk_size)).all()
+        if not rows:
+            return
+        yield from rows
+        after = rows[-1].id
+        if len(rows) < chunk_size:
+            return
+
+
+def _value(value):
+    if value is None:
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def header(dataset, fmt):
+    if fmt != "csv":
+        return ""
+    return encode_csv(DATASETS[dataset][1])
+
+
+def encode_csv(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(["" if value is None else _value(value) for value in values])
+    return buffer.getvalue()
+
+
+def encode(row, fmt):
+    if fmt == "csv":
+        return encode_csv(row)
+    return json.dumps({key: _value(value) for key, value in row._mapping.items()}) + "\n"
+
+
+def stream(dataset, fmt, user_id=None, after=0, batch=200):
+    # Yields text in small batches rather than one write per row
+    if not after and fmt == "csv":
+        yield header(dataset, fmt)
+    parts = []
+    for row in iter_rows(dataset, user_id=user_id, after=after):
+        parts.append(encode(row, fmt))
+        if len(parts) >= batch:
+            yield "".join(parts)
+            parts = []
+    if parts:
+        yield "".join(parts)
+
+
+def export_response(dataset, fmt, user_id=None):
+    if dataset not in DATASETS or fmt not in FORMATS:
+        abort(404)
+    after = request.args.get("after", 0, type=int)
+    body = stream_with_context(stream(dataset, fmt, user_id=user_id, after=after))
+    return Response(body, mimetype=FORMATS[fmt], headers={
+        "Content-Disposition": f'attachment; filename="{dataset}.{fmt}"',
+        "X-Accel-Buffering": "no",
+    })
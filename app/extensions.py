@@ -2,9 +2,10 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_wtf import CSRFProtect
+from .routing import RoutingSession
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 login_manager = LoginManager()
 migrate = Migrate()
 csrf = CSRFProtect()
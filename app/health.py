@@ -0,0 +1,27 @@
+from flask import Blueprint, jsonify
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from .extensions import db
+from .routing import replicas
+
+
+health_bp = Blueprint("health", __name__)
+
+
+@health_bp.route("/healthz")
+def healthz():
+    # Liveness only: the process is up and serving requests
+    return jsonify(status="ok")
+
+
+@health_bp.route("/readyz")
+def readyz():
+    try:
+        db.session.execute(text("SELECT 1"))
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify(status="unavailable", database="error"), 503
+    finally:
+        db.session.close()
+    # Replicas don't affect readiness; reads fall back to the primary
+    return jsonify(status="ok", database="ok", pool=db.engine.pool.status(), replicas=replicas.status(db))
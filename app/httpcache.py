@@ -0,0 +1,58 @@
+from functools import wraps
+import hashlib
+from flask import make_response, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+from .catalog import catalog
+from .extensions import db
+from .models import UserStats
+
+
+def _validators(view_args):
+    # Read from the database, not current_user.stats: with USER_CACHE_TTL this
+    # worker's cached copy can predate a save handled by another worker, and a
+    # stale version would answer 304 with the pre-save page
+    stats = db.session.execute(
+        db.select(UserStats.progress_version, UserStats.progress_updated_at)
+        .where(UserStats.user_id == current_user.id)
+    ).first()
+    progress = stats.progress_version if stats else 0
+    raw = "|".join(str(part) for part in (
+        request.endpoint,
+        sorted(view_args.items()),
+        request.query_string.decode("latin-1"),
+        catalog.version,
+        current_user.id,
+        progress,
+        # Pages embed a CSRF token tied to the session's raw token
+        session.get("csrf_token"),
+    ))
+    etag = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    stamps = [ts for ts in (catalog.updated_at, stats.progress_updated_at if stats else None) if ts]
+    return etag, max(stamps).replace(microsecond=0) if stamps else None
+
+
+def conditional_page(view):
+    # Answers If-None-Match / If-Modified-Since with 304 before the view runs.
+    # Validators come from the catalog version and the user's progress version,
+    # so catalog edits or the user's own saves produce a fresh page.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        catalog.chapters()  # refresh catalog.version/updated_at if due
+        etag, last_modified = _validators(kwargs)
+        if not session.get("_flashes") and not is_resource_modified(
+            request.environ, etag=etag, last_modified=last_modified
+        ):
+            response = make_response("", 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            etag, last_modified = _validators(kwargs)
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.vary.add("Cookie")
+        return response
+    return wrapper
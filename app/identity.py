@@ -0,0 +1,99 @@
+from threading import Lock
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from .extensions import db
+from .models import User, UserStats
+
+
+def _columns(obj):
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+
+class IdentityCache:
+    # Optional per-worker cache of User + UserStats column values, enabled by
+    # USER_CACHE_TTL > 0. Cached rows are re-attached to the request session
+    # without a query, so routes can keep mutating current_user.stats.
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = {}
+
+    def invalidate(self, user_ids=None):
+        with self._lock:
+            if user_ids is None:
+                self._entries.clear()
+            else:
+                for user_id in user_ids:
+                    self._entries.pop(user_id, None)
+
+    def load(self, user_id):
+        ttl = current_app.config.get("USER_CACHE_TTL", 0)
+        if ttl > 0:
+            entry = self._entries.get(user_id)
+            if entry and time.monotonic() - entry[0] < ttl:
+                return self._attach(*entry[1:])
+
+        user = db.session.execute(
+            db.select(User).options(joinedload(User.stats)).where(User.id == user_id)
+        ).unique().scalar_one_or_none()
+        if user is not None and ttl > 0:
+            stats = _columns(user.stats) if user.stats else None
+            with self._lock:
+                self._entries[user_id] = (time.monotonic(), _columns(user), stats)
+        return user
+
+    def _attach(self, user_values, stats_values):
+        existing = db.session.identity_map.get(db.session.identity_key(User, user_values["id"]))
+        if existing is not None:
+            return existing
+        user = User(**user_values)
+        stats = UserStats(**stats_values) if stats_values else None
+        user.stats = stats
+        if stats is not None:
+            make_transient_to_detached(stats)
+        make_transient_to_detached(user)
+        db.session.add(user)
+        return user
+
+
+identity_cache = IdentityCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _track_identity_writes(session, flush_context):
+    dirty = session.info.setdefault("identity_dirty", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            dirty.add(obj.id)
+        elif isinstance(obj, UserStats):
+            dirty.add(obj.user_id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_identity_writes(orm_execute_state):
+    # UPDATE/DELETE statements don't say which users they touched unless they
+    # carry an identity_user_id execution option; otherwise drop everything
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper is not None:
+        if orm_execute_state.bind_mapper.class_ in (User, UserStats):
+            user_id = orm_execute_state.execution_options.get("identity_user_id")
+            if user_id is not None:
+                orm_execute_state.session.info.setdefault("identity_dirty", set()).add(user_id)
+            else:
+                orm_execute_state.session.info["identity_dirty_all"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_identities(session):
+    if session.info.pop("identity_dirty_all", False):
+        identity_cache.invalidate()
+    dirty = session.info.pop("identity_dirty", None)
+    if dirty:
+        identity_cache.invalidate(dirty)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_identity_writes(session):
+    session.info.pop("identity_dirty", None)
+    session.info.pop("identity_dirty_all", None)
@@ -0,0 +1,201 @@
+import json
+from .extensions import db
+from .models import Chapter, Problem, ProblemTest, Tag, ProblemTag
+from .search import index_problems
+from .utils import slugify, add_chapter_problems
+
+
+def _problems(chapter_data, where):
+    problems = chapter_data.get("problems", [])
+    if not isinstance(problems, list):
+        raise ValueError(f"{where}: \"problems\" must be a list")
+    return problems
+
+
+def iter_json(stream):
+    data = json.load(stream)
+    chapters = data.get("chapters", []) if isinstance(data, dict) else None
+    if not isinstance(chapters, list):
+        raise ValueError("expected an object with a \"chapters\" list")
+    for index, chapter_data in enumerate(chapters, start=1):
+        if not isinstance(chapter_data, dict):
+            raise ValueError(f"Chapter {index}: not an object")
+        for p in _problems(chapter_data, f"Chapter {index}"):
+            yield chapter_data, p
+
+
+def iter_ndjson(stream):
+    # One object per line: either a chapter with its "problems", or a single
+    # problem carrying "chapter" (title) and optional "chapter_position".
+    for lineno, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Line {lineno}: {exc.msg}") from exc
+        if not isinstance(item, dict):
+            raise ValueError(f"Line {lineno}: not an object")
+        if "problems" in item:
+            for p in _problems(item, f"Line {lineno}"):
+                yield item, p
+        elif "chapter" in item:
+            yield {"title": item["chapter"], "position": item.get("chapter_position", 0)}, item
+        else:
+            raise ValueError(f"Line {lineno}: missing chapter")
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_text(value, max_length=None):
+    return isinstance(value, str) and (max_length is None or len(value) <= max_length)
+
+
+def validate(chapter_data, p):
+    # Returns why a record can't be imported, or None
+    if not isinstance(chapter_data, dict) or not isinstance(p, dict):
+        return "not an object"
+    if not _is_text(chapter_data.get("title"), 120) or not chapter_data["title"].strip():
+        return "chapter needs a title of at most 120 characters"
+    slug = slugify(chapter_data["title"])
+    if not slug or len(slug) > 120:
+        return "chapter title needs letters or digits"
+    if not _is_int(chapter_data.get("position", 0)):
+        return "chapter position must be an integer"
+    if not _is_text(p.get("title"), 200) or not p["title"].strip():
+        return "problem needs a title of at most 200 characters"
+    if not _is_text(p.get("difficulty", "easy"), 32):
+        return "difficulty must be a string"
+    if not _is_int(p.get("points", 10)) or p.get("points", 10) < 0:
+        return "points must be a non-negative integer"
+    if not _is_text(p.get("prompt", "")):
+        return "prompt must be a string"
+    tags = p.get("tags", [])
+    if not isinstance(tags, list) or not all(_is_text(t, 64) for t in tags):
+        return "tags must be a list of strings"
+    tests = p.get("tests", [])
+    if not isinstance(tests, list):
+        return "tests must be a list"
+    for t in tests:
+        if not isinstance(t, dict) or not _is_text(t.get("expected")) or not _is_text(t.get("input", "")):
+            return "each test needs string \"expected\" (and optional \"input\")"
+        if not isinstance(t.get("hidden", False), bool):
+            return "test \"hidden\" must be true or false"
+    return None
+
+
+class ProblemImporter:
+    # Records are validated before they are batched, and invalid ones are
+    # skipped and listed in `invalid` rather than aborting the import. Each
+    # batch commits on its own, so an interrupted import keeps the batches
+    # before it; re-running the same file resumes it, because problems that
+    # already exist (same chapter and title) are skipped.
+
+    def __init__(self, batch_size=500, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.created = 0
+        self.skipped = 0
+        self.invalid = []  # (record number, title, reason)
+        self.seen = 0
+        self.chapters = {c.slug: c.id for c in Chapter.query.all()}
+        self.tags = dict(db.session.execute(db.select(Tag.name, Tag.id)).all())
+        self.existing = set(db.session.execute(db.select(Problem.chapter_id, Problem.title)).all())
+        self.batch = []
+
+    def run(self, items):
+        for chapter_data, p in items:
+            self.add(chapter_data, p)
+        self.flush()
+        return self.created, self.skipped
+
+    def add(self, chapter_data, p):
+        self.seen += 1
+        error = validate(chapter_data, p)
+        if error:
+            title = p.get("title") if isinstance(p, dict) else None
+            self.invalid.append((self.seen, title if isinstance(title, str) else "", error))
+            return
+        chapter_id = self._chapter_id(chapter_data)
+        key = (chapter_id, p["title"])
+        if key in self.existing:
+            self.skipped += 1
+            return
+        self.existing.add(key)
+        tags = [t.strip().lower() for t in p.get("tags", []) if t.strip()]
+        # [{"input": ..., "expected": ..., "hidden": false}, ...]
+        tests = [
+            {
+                "position": position,
+                "input": t.get("input", ""),
+                "expected": t["expected"],
+                "is_hidden": bool(t.get("hidden", False)),
+            }
+            for position, t in enumerate(p.get("tests", []))
+        ]
+        row = {
+            "chapter_id": chapter_id,
+            "title": p["title"],
+            "difficulty": p.get("difficulty", "easy"),
+            "points": p.get("points", 10),
+            "prompt": p.get("prompt", ""),
+            "tests_version": 1 if tests else 0,
+        }
+        self.batch.append((row, list(dict.fromkeys(tags)), tests))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        new_tags = sorted({t for _, tags, _ in self.batch for t in tags if t not in self.tags})
+        if new_tags:
+            result = db.session.execute(
+                db.insert(Tag).returning(Tag.id, Tag.name, sort_by_parameter_order=True),
+                [{"name": name} for name in new_tags],
+            )
+            self.tags.update({name: tag_id for tag_id, name in result})
+
+        problem_ids = db.session.execute(
+            db.insert(Problem).returning(Problem.id, sort_by_parameter_order=True),
+            [row for row, _, _ in self.batch],
+        ).scalars().all()
+        tag_rows = [
+            {"problem_id": problem_id, "tag_id": self.tags[name]}
+            for problem_id, (_, tags, _) in zip(problem_ids, self.batch)
+            for name in tags
+        ]
+        if tag_rows:
+            db.session.execute(db.insert(ProblemTag), tag_rows)
+        test_rows = [
+            dict(test, problem_id=problem_id)
+            for problem_id, (_, _, tests) in zip(problem_ids, self.batch)
+            for test in tests
+        ]
+        if test_rows:
+            db.session.execute(db.insert(ProblemTest), test_rows)
+
+        per_chapter = {}
+        for row, _, _ in self.batch:
+            per_chapter[row["chapter_id"]] = per_chapter.get(row["chapter_id"], 0) + 1
+        for chapter_id, count in per_chapter.items():
+            add_chapter_problems(chapter_id, count)
+        index_problems(problem_ids)
+
+        db.session.commit()
+        self.created += len(self.batch)
+        self.batch = []
+        if self.progress:
+            self.progress(self.created, self.skipped + len(self.invalid))
+
+    def _chapter_id(self, chapter_data):
+        slug = slugify(chapter_data["title"])
+        if slug not in self.chapters:
+            chapter = Chapter(title=chapter_data["title"], slug=slug, position=chapter_data.get("position", 0))
+            db.session.add(chapter)
+            db.session.flush()
+            self.chapters[slug] = chapter.id
+        return self.chapters[slug]
@@ -0,0 +1,160 @@
+from collections import Counter
+import json
+import re
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+_whitespace = re.compile(r"\s+")
+_placeholder_list = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|__\[POSTCOMPILE_\w+\])\s*,?)+\)")
+
+
+def fingerprint(statement: str) -> str:
+    # Statements are already parameterised; collapse whitespace and IN-lists
+    statement = _whitespace.sub(" ", statement).strip()
+    return _placeholder_list.sub("(?)", statement)
+
+
+def _value_bytes(value):
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    return 8
+
+
+class CountingCursor:
+    # Wraps a DBAPI cursor and reports the approximate size of every row
+    # fetched through it to `sink`; everything else passes straight through.
+
+    def __init__(self, cursor, sink):
+        self._cursor = cursor
+        self._sink = sink
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._sink(sum(_value_bytes(value) for value in row))
+            yield row
+
+    def _count(self, rows):
+        self._sink(sum(_value_bytes(value) for row in rows for value in row))
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._count((row,))
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        return self._count(self._cursor.fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        return self._count(self._cursor.fetchall())
+
+
+def count_fetched_bytes(context, cursor, sink):
+    # Call from after_cursor_execute: the result is built from context.cursor
+    # afterwards, so swapping in a CountingCursor sees every fetched row.
+    if context is not None and cursor.description:
+        context.cursor = CountingCursor(cursor, sink)
+
+
+def _add_bytes(n):
+    if has_request_context() and "sql_stats" in g:
+        g.sql_stats["bytes"] += n
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "sql_stats" in g:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or "sql_stats" not in g:
+        return
+    starts = conn.info.get("query_start")
+    elapsed = time.perf_counter() - starts.pop() if starts else 0.0
+    stats = g.sql_stats
+    stats["count"] += 1
+    stats["time"] += elapsed
+    stats["fingerprints"][fingerprint(statement)] += 1
+    count_fetched_bytes(context, cursor, _add_bytes)
+
+
+def _budget_for(app):
+    budgets = app.config.get("SQL_QUERY_BUDGETS") or {}
+    return budgets.get(request.endpoint, app.config.get("SQL_QUERY_BUDGET", 0))
+
+
+def _byte_budget_for(app):
+    return (app.config.get("SQL_BYTE_BUDGETS") or {}).get(request.endpoint, 0)
+
+
+def _over_budget(app, message):
+    if app.config.get("SQL_QUERY_BUDGET_STRICT"):
+        raise QueryBudgetExceeded(message)
+    app.logger.warning(message)
+
+
+def init_app(app):
+    # Opt-in: SQL_INSTRUMENTATION enables per-request query counting,
+    # Server-Timing headers, the slow request log and query/byte budgets.
+    if not app.config.get("SQL_INSTRUMENTATION"):
+        return
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.before_request
+    def _start_sql_stats():
+        g.sql_stats = {"count": 0, "time": 0.0, "bytes": 0, "fingerprints": Counter(), "started": time.perf_counter()}
+
+    @app.after_request
+    def _report_sql_stats(response):
+        stats = g.pop("sql_stats", None)
+        if stats is None:
+            return response
+        total_ms = (time.perf_counter() - stats["started"]) * 1000
+        db_ms = stats["time"] * 1000
+        threshold = app.config.get("SQL_REPEAT_THRESHOLD", 5)
+        repeated = {fp: n for fp, n in stats["fingerprints"].items() if n >= threshold}
+
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={db_ms:.1f};desc="{stats["count"]} queries, {stats["bytes"]} bytes", app;dur={total_ms:.1f}',
+        )
+
+        if total_ms >= app.config.get("SLOW_REQUEST_MS", 500) or repeated:
+            app.logger.warning(json.dumps({
+                "event": "slow_request" if total_ms >= app.config.get("SLOW_REQUEST_MS", 500) else "repeated_queries",
+                "method": request.method,
+                "endpoint": request.endpoint,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(total_ms, 1),
+                "db_ms": round(db_ms, 1),
+                "queries": stats["count"],
+                "bytes": stats["bytes"],
+                "repeated": repeated,
+            }))
+
+        budget = _budget_for(app)
+        if budget and stats["count"] > budget:
+            _over_budget(app, f"{request.endpoint} issued {stats['count']} queries (budget {budget})")
+        budget = _byte_budget_for(app)
+        if budget and stats["bytes"] > budget:
+            _over_budget(app, f"{request.endpoint} fetched {stats['bytes']} bytes (budget {budget})")
+        return response
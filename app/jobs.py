@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import random
+import socket
+import time
+from flask import current_app
+from sqlalchemy import and_, or_
+from .extensions import db
+from .models import Job
+
+
+# Durable job queue in the jobs table. enqueue() adds a row to the caller's
+# transaction, so work is queued only if the request's own write commits.
+# `flask worker` claims ready rows in batches (FOR UPDATE SKIP LOCKED on
+# Postgres; SQLite ignores the lock clause and its single writer gives the
+# same exclusivity), runs each kind's handler on a thread pool with the
+# whole batch of payloads, deletes finished rows and retries failures with
+# exponential backoff until max_attempts, after which they stay "failed".
+
+log = logging.getLogger(__name__)
+HANDLERS = {}
+FAILURE_HANDLERS = {}
+
+
+def handler(kind, on_failure=None):
+    # Handlers take a list of payloads and run inside an app context; the
+    # worker commits after them. on_failure gets the payloads of jobs that
+    # failed for good, in the transaction that marks them failed.
+    def register(fn):
+        HANDLERS[kind] = fn
+        if on_failure is not None:
+            FAILURE_HANDLERS[kind] = on_failure
+        return fn
+    return register
+
+
+def _give_up(kind, payloads):
+    if kind in FAILURE_HANDLERS and payloads:
+        FAILURE_HANDLERS[kind]([json.loads(payload) for payload in payloads])
+
+
+def enqueue(kind, payload, delay=0):
+    if kind not in HANDLERS:
+        raise KeyError(f"No job handler for {kind!r}")
+    if current_app.config.get("JOBS_INLINE"):
+        HANDLERS[kind]([payload])
+        return None
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        max_attempts=current_app.config.get("JOB_MAX_ATTEMPTS", 5),
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    return job
+
+
+def claim(worker_id, batch_size):
+    now = datetime.utcnow()
+    lease = now - timedelta(seconds=current_app.config.get("JOB_LEASE_SECONDS", 300))
+    expired = and_(Job.status == "running", Job.locked_at < lease)
+    # A job whose lease ran out on its last attempt most likely killed or hung
+    # its worker; running it again would do the same forever
+    exhausted = db.session.execute(
+        db.update(Job)
+        .where(expired, Job.attempts >= Job.max_attempts)
+        .values(status="failed", locked_at=None, locked_by=None,
+                last_error="Lease expired on the last attempt (worker died or hung)")
+        .returning(Job.kind, Job.payload)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if exhausted:
+        log.error("%d job(s) failed permanently after their lease expired", len(exhausted))
+        by_kind = {}
+        for kind, payload in exhausted:
+            by_kind.setdefault(kind, []).append(payload)
+        for kind, payloads in by_kind.items():
+            _give_up(kind, payloads)
+    ready = (
+        db.select(Job.id)
+        .where(or_(
+            and_(Job.status == "queued", Job.run_at <= now),
+            and_(expired, Job.attempts < Job.max_attempts),
+        ))
+        .order_by(Job.run_at.asc(), Job.id.asc())
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    rows = db.session.execute(
+        db.update(Job)
+        .where(Job.id.in_(ready.scalar_subquery()))
+        .values(status="running", locked_at=now, locked_by=worker_id, attempts=Job.attempts + 1)
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return rows
+
+
+def _backoff(attempts):
+    base = current_app.config.get("JOB_BACKOFF_SECONDS", 5)
+    return min(base * 2 ** (attempts - 1), 3600) * random.uniform(0.8, 1.2)
+
+
+def _fail(job, exc):
+    now = datetime.utcnow()
+    values = {"last_error": f"{type(exc).__name__}: {exc}"[:2000], "locked_at": None, "locked_by": None}
+    if job.attempts >= job.max_attempts:
+        values["status"] = "failed"
+        log.error("Job %s (%s) failed permanently: %s", job.id, job.kind, exc)
+        try:
+            _give_up(job.kind, [job.payload])
+        except Exception:
+            log.exception("Failure handler for job %s (%s) raised", job.id, job.kind)
+            db.session.rollback()
+    else:
+        values.update(status="queued", run_at=now + timedelta(seconds=_backoff(job.attempts)))
+    db.session.execute(db.update(Job).where(Job.id == job.id).values(**values))
+    db.session.commit()
+
+
+def _run(jobs):
+    try:
+        HANDLERS[jobs[0].kind]([json.loads(job.payload) for job in jobs])
+        db.session.execute(db.delete(Job).where(Job.id.in_([job.id for job in jobs])))
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        if len(jobs) > 1:
+            # Isolate the bad payload instead of retrying the whole batch
+            for job in jobs:
+                _run([job])
+        else:
+            _fail(jobs[0], exc)
+
+
+def _run_group(app, jobs):
+    with app.app_context():
+        try:
+            if jobs[0].kind not in HANDLERS:
+                for job in jobs:
+                    _fail(job, KeyError(f"No job handler for {job.kind!r}"))
+            else:
+                _run(jobs)
+        finally:
+            db.session.remove()
+
+
+def run_worker(concurrency=4, batch_size=100, poll_interval=1.0, once=False, should_stop=lambda: False):
+    app = current_app._get_current_object()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    processed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while not should_stop():
+            jobs = claim(worker_id, batch_size)
+            groups = {}
+            for job in jobs:
+                groups.setdefault(job.kind, []).append(job)
+            list(pool.map(lambda group: _run_group(app, group), groups.values()))
+            processed += len(jobs)
+            if once and not jobs:
+                break
+            if len(jobs) < batch_size and not once:
+                time.sleep(poll_interval)
+    return processed
@@ -0,0 +1,118 @@
+from datetime import date
+from .extensions import db
+from .models import LeaderboardScore, User, UserProblem, UserStats, Problem
+from .utils import week_board
+
+
+PAGE_SIZE = 50
+
+
+def board_key(kind: str, chapter_id: int = None, today: date = None) -> str:
+    if kind == "weekly":
+        return week_board(today or date.today())
+    if kind == "chapter" and chapter_id:
+        return f"chapter:{chapter_id}"
+    return "global"
+
+
+def public_name():
+    # Users without a display name get an opaque handle, never their email
+    return db.func.coalesce(User.display_name, db.literal("Learner #") + db.cast(User.id, db.String))
+
+
+def purge_weekly(weeks_to_keep: int, today: date = None):
+    # Board keys sort chronologically ("week:2026-09" < "week:2026-10")
+    today = today or date.today()
+    oldest = week_board(date.fromordinal(today.toordinal() - 7 * (weeks_to_keep - 1)))
+    return db.session.execute(
+        db.delete(LeaderboardScore).where(LeaderboardScore.board.like("week:%"), LeaderboardScore.board < oldest)
+    ).rowcount
+
+
+def _ahead_of(score: int, user_id: int):
+    # Rows ranked before (score, user_id): higher score, ties broken by user id
+    return db.or_(
+        LeaderboardScore.score > score,
+        db.and_(LeaderboardScore.score == score, LeaderboardScore.user_id < user_id),
+    )
+
+
+def rank_of(board: str, user_id: int):
+    score = db.session.execute(
+        db.select(LeaderboardScore.score).where(LeaderboardScore.board == board, LeaderboardScore.user_id == user_id)
+    ).scalar()
+    if score is None:
+        return None, 0
+    ahead = db.session.execute(
+        db.select(db.func.count()).where(LeaderboardScore.board == board, _ahead_of(score, user_id))
+    ).scalar()
+    return ahead + 1, score
+
+
+def page(board: str, after=None, limit: int = PAGE_SIZE):
+    # Keyset pagination on (score desc, user_id asc); `after` is the last (score, user_id) seen
+    query = (
+        db.select(LeaderboardScore.user_id, public_name().label("name"), LeaderboardScore.score)
+        .join(User, User.id == LeaderboardScore.user_id)
+        .where(LeaderboardScore.board == board)
+        .order_by(LeaderboardScore.score.desc(), LeaderboardScore.user_id.asc())
+        .limit(limit)
+    )
+    first_rank = 1
+    if after:
+        score, user_id = after
+        query = query.where(db.not_(_ahead_of(score, user_id)), LeaderboardScore.user_id != user_id)
+        first_rank = db.session.execute(
+            db.select(db.func.count()).where(LeaderboardScore.board == board, _ahead_of(score, user_id))
+        ).scalar() + 2
+    rows = db.session.execute(query).all()
+    return [(first_rank + i, row) for i, row in enumerate(rows)]
+
+
+def rebuild(weeks_to_keep: int = 8, today: date = None, user_range=None, commit=True):
+    # Recomputes every board from user_stats and solves; `user_range` (lo, hi)
+    # limits it to those user ids, e.g. one recompute_stats chunk.
+    today = today or date.today()
+
+    def in_range(column):
+        return column.between(*user_range) if user_range else db.true()
+
+    db.session.execute(db.delete(LeaderboardScore).where(in_range(LeaderboardScore.user_id)))
+    columns = ["board", "user_id", "score"]
+    db.session.execute(
+        db.insert(LeaderboardScore).from_select(
+            columns,
+            db.select(db.literal("global"), UserStats.user_id, UserStats.xp)
+            .where(UserStats.xp > 0, in_range(UserStats.user_id)),
+        )
+    )
+    solved = (
+        db.select(UserProblem.user_id, Problem.chapter_id, UserProblem.solved_at, Problem.points)
+        .join(Problem, Problem.id == UserProblem.problem_id)
+        .where(UserProblem.status == "solved", in_range(UserProblem.user_id))
+        .subquery()
+    )
+    db.session.execute(
+        db.insert(LeaderboardScore).from_select(
+            columns,
+            db.select(
+                db.literal("chapter:") + db.cast(solved.c.chapter_id, db.String),
+                solved.c.user_id,
+                db.func.sum(solved.c.points),
+            ).group_by(solved.c.chapter_id, solved.c.user_id),
+        )
+    )
+    # Weekly boards are rebuilt from solve timestamps, one week at a time
+    for offset in range(weeks_to_keep):
+        week_start = date.fromordinal(today.toordinal() - today.weekday() - 7 * offset)
+        week_end = date.fromordinal(week_start.toordinal() + 7)
+        db.session.execute(
+            db.insert(LeaderboardScore).from_select(
+                columns,
+                db.select(db.literal(week_board(week_start)), solved.c.user_id, db.func.sum(solved.c.points))
+                .where(solved.c.solved_at >= week_start, solved.c.solved_at < week_end)
+                .group_by(solved.c.user_id),
+            )
+        )
+    if commit:
+        db.session.commit()
@@ -1,14 +1,35 @@
 from datetime import date, datetime
-from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
+import json
+from flask import Blueprint, current_app, render_template, redirect, url_for, request, flash, jsonify, abort
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
 from .extensions import db
-from .models import Chapter, Problem, UserProblem, UserStats, ActivityLog
-from .utils import add_xp, update_streak, add_daily_time
+from .catalog import catalog
+from .leaderboard import PAGE_SIZE, board_key, page, rank_of
+from .recommend import next_problem, tag_completion
+from .search import PAGE_SIZE as SEARCH_PAGE_SIZE, search
+from .revisions import apply_splices, base_hash, list_revisions, load_revision, normalize_newlines, record_revision
+from .timeseries import activity_series
+from .models import ChapterProgress, Problem, Submission, UserProblem, UserStats, ActivityLog
+from .export import export_response
+from .httpcache import conditional_page
+from .routing import use_primary
+from .runner import award_solve, has_tests, submission_json, submit
+from .tasks import defer_activity, defer_time
+from .utils import bump_stats
+from . import ratelimit
 
 
 main_bp = Blueprint("main", __name__)
 
 
+def _get_problem_or_404(problem_id):
+    problem = catalog.problem(problem_id)
+    if not problem:
+        abort(404)
+    return problem
+
+
 @main_bp.route("/")
 def index():
     if current_user.is_authenticated:
@@ -21,20 +42,20 @@ def index():
 def dashboard():
     stats = current_user.stats
     today = date.today()
-    today_activity = ActivityLog.query.filter(
-        ActivityLog.user_id == current_user.id,
-        ActivityLog.created_at >= datetime.combine(today, datetime.min.time()),
-    ).order_by(ActivityLog.created_at.desc()).limit(10).all()
+    today_activity = db.session.execute(
+        db.select(ActivityLog.action, ActivityLog.created_at).where(
+            ActivityLog.user_id == current_user.id,
+            ActivityLog.created_at >= datetime.combine(today, datetime.min.time()),
+        ).order_by(ActivityLog.created_at.desc()).limit(10)
+    ).all()
 
-    chapters = Chapter.query.order_by(Chapter.position.asc()).all()
+    solved_by_chapter = dict(db.session.execute(
+        db.select(ChapterProgress.chapter_id, ChapterProgress.solved).where(ChapterProgress.user_id == current_user.id)
+    ).all())
     chapter_progress = []
-    for chapter in chapters:
-        total = len(chapter.problems)
-        solved = UserProblem.query.join(Problem).filter(
-            UserProblem.user_id == current_user.id,
-            Problem.chapter_id == chapter.id,
-            UserProblem.status == "solved",
-        ).count()
+    for chapter in catalog.chapters():
+        solved = solved_by_chapter.get(chapter.id, 0)
+        total = chapter.problem_count
         pct = int((solved / total) * 100) if total else 0
         chapter_progress.append((chapter, solved, total, pct))
 
@@ -48,59 +69,221 @@ def dashboard():
 
 @main_bp.route("/chapters")
 @login_required
+@conditional_page
 def chapters():
-    chapters = Chapter.query.order_by(Chapter.position.asc()).all()
-    return render_template("chapters.html", chapters=chapters)
+    return render_template("chapters.html", chapters=catalog.chapters())
 
 
 @main_bp.route("/chapters/<slug>")
 @login_required
+@conditional_page
 def chapter_detail(slug):
-    chapter = Chapter.query.filter_by(slug=slug).first_or_404()
-    problems = Problem.query.filter_by(chapter_id=chapter.id).all()
-    status_map = {up.problem_id: up for up in UserProblem.query.filter_by(user_id=current_user.id).all()}
+    chapter = catalog.chapter_by_slug(slug)
+    if not chapter:
+        abort(404)
+    problems = catalog.chapter_problems(chapter.id)
+    # Only this chapter's statuses; code and notes stay in the database
+    status_map = dict(db.session.execute(
+        db.select(UserProblem.problem_id, UserProblem.status).where(
+            UserProblem.user_id == current_user.id,
+            UserProblem.problem_id.in_([p.id for p in problems]),
+        )
+    ).all())
     return render_template("chapter.html", chapter=chapter, problems=problems, status_map=status_map)
 
 
 @main_bp.route("/problems/<int:problem_id>")
 @login_required
+@conditional_page
 def problem_detail(problem_id):
-    problem = Problem.query.get_or_404(problem_id)
-    user_problem = UserProblem.query.filter_by(user_id=current_user.id, problem_id=problem.id).first()
+    problem = _get_problem_or_404(problem_id)
+    prompt = db.session.execute(db.select(Problem.prompt).where(Problem.id == problem.id)).scalar()
+    query = UserProblem.query.options(db.undefer_group("content")).filter_by(
+        user_id=current_user.id, problem_id=problem.id
+    )
+    user_problem = query.first()
+    if not user_problem:
+        # First open writes, so make sure the row really is missing
+        use_primary()
+        user_problem = query.first()
     if not user_problem:
         user_problem = UserProblem(user_id=current_user.id, problem_id=problem.id, last_opened_at=datetime.utcnow())
         db.session.add(user_problem)
-        db.session.add(ActivityLog(user_id=current_user.id, action="open_problem", ref_type="problem", ref_id=problem.id))
-        db.session.commit()
-    return render_template("problem.html", problem=problem, user_problem=user_problem)
+        defer_activity(current_user.id, "open_problem", "problem", problem.id)
+        bump_stats(current_user.id, progress=True)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Opened at the same moment in another tab
+            db.session.rollback()
+            user_problem = query.one()
+    revisions = list_revisions(user_problem.id, limit=10) if user_problem.revision else []
+    return render_template(
+        "problem.html", problem=problem, prompt=prompt, user_problem=user_problem, revisions=revisions,
+        has_tests=has_tests(problem.id),
+    )
 
 
 @main_bp.route("/problems/<int:problem_id>/save", methods=["POST"])
 @login_required
 def save_problem(problem_id):
-    problem = Problem.query.get_or_404(problem_id)
-    user_problem = UserProblem.query.filter_by(user_id=current_user.id, problem_id=problem.id).first()
+    problem = _get_problem_or_404(problem_id)
+    user_problem = UserProblem.query.options(db.undefer_group("content")).filter_by(
+        user_id=current_user.id, problem_id=problem.id
+    ).first()
     if not user_problem:
         user_problem = UserProblem(user_id=current_user.id, problem_id=problem.id)
         db.session.add(user_problem)
-    user_problem.code = request.form.get("code", "")
-    user_problem.notes = request.form.get("notes", "")
+        db.session.flush()
+    mark_solved = request.form.get("mark_solved") == "true"
+    changed = record_revision(user_problem, request.form.get("code", ""), request.form.get("notes", ""))
+    if not changed and not mark_solved:
+        db.session.commit()
+        flash("No changes to save.", "success")
+        return redirect(url_for("main.problem_detail", problem_id=problem.id))
     user_problem.last_saved_at = datetime.utcnow()
 
-    if request.form.get("mark_solved") == "true":
-        user_problem.status = "solved"
-        user_problem.solved_at = datetime.utcnow()
-        add_xp(current_user.stats, problem.points)
-        db.session.add(ActivityLog(user_id=current_user.id, action="solve_problem", ref_type="problem", ref_id=problem.id))
+    if user_problem.status == "unsolved":
+        user_problem.status = "attempted"
+    submission, xp, wait = None, 0, 0
+    if mark_solved and has_tests(problem.id):
+        # Only a passing run awards the solve; runs share the /run budget
+        wait = ratelimit.check("run_user", current_user.id)
+        if not wait:
+            submission = submit(user_problem, user_problem.code, award=True)
+    elif mark_solved and award_solve(user_problem, problem, bump=False):
+        xp = problem.points
+    if not mark_solved or submission is not None or wait:
+        defer_activity(current_user.id, "save_problem", "problem", problem.id)
+    bump_stats(current_user.id, xp=xp, today=date.today(), progress=True)
+    db.session.commit()
+    if wait:
+        flash(f"Saved, but you're submitting too often; try again in {int(wait) + 1}s.", "error")
+    elif submission is None:
+        flash("Saved.", "success")
+    elif submission.status == "error":
+        flash("Saved, but the tests can't be run right now; try again later.", "error")
+    elif submission.status != "done":
+        flash("Saved. Your code is being checked; refresh in a moment.", "success")
+    elif submission.passed:
+        flash("All tests passed. Solved!", "success")
     else:
-        if user_problem.status == "unsolved":
-            user_problem.status = "attempted"
-        db.session.add(ActivityLog(user_id=current_user.id, action="save_problem", ref_type="problem", ref_id=problem.id))
+        flash("Saved, but some tests failed.", "error")
+    return redirect(url_for("main.problem_detail", problem_id=problem.id))
+
+
+@main_bp.route("/problems/<int:problem_id>/autosave", methods=["POST"])
+@login_required
+def autosave(problem_id):
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"ok": False}), 400
+    # Row lock: coalesced autosaves rewrite a revision in place, so the
+    # revision number alone can't catch two tabs saving at once
+    user_problem = UserProblem.query.options(db.undefer_group("content")).filter_by(
+        user_id=current_user.id, problem_id=problem_id
+    ).with_for_update().first_or_404()
+    # Splices are offsets into the text the client last saw; if that isn't
+    # exactly what's stored they would land in the wrong place
+    if payload.get("version") != user_problem.revision or payload.get("base") != base_hash(user_problem):
+        return jsonify({"ok": False, "conflict": True, "version": user_problem.revision}), 409
+    try:
+        code = apply_splices(normalize_newlines(user_problem.code), payload.get("code"))
+        notes = apply_splices(normalize_newlines(user_problem.notes), payload.get("notes"))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"ok": False}), 400
+    window = current_app.config.get("AUTOSAVE_COALESCE_SECONDS", 600)
+    if record_revision(user_problem, code, notes, autosave_window=window):
+        user_problem.last_saved_at = datetime.utcnow()
+        bump_stats(current_user.id, progress=True)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another tab claimed this revision number first
+            db.session.rollback()
+            return jsonify({"ok": False, "conflict": True}), 409
+    return jsonify({"ok": True, "version": user_problem.revision})
 
-    update_streak(current_user.stats, date.today())
+
+@main_bp.route("/problems/<int:problem_id>/revisions")
+@login_required
+def problem_revisions(problem_id):
+    user_problem = UserProblem.query.filter_by(user_id=current_user.id, problem_id=problem_id).first_or_404()
+    limit = min(request.args.get("limit", 50, type=int), 200)
+    return jsonify({
+        "current": user_problem.revision,
+        "revisions": [
+            {
+                "number": r.number,
+                "created_at": r.created_at.isoformat(),
+                "size": r.size,
+                "snapshot": r.is_snapshot,
+                "autosave": r.is_autosave,
+                "hash": r.content_hash,
+            }
+            for r in list_revisions(user_problem.id, limit=limit)
+        ],
+    })
+
+
+@main_bp.route("/problems/<int:problem_id>/revisions/<int:number>")
+@login_required
+def problem_revision(problem_id, number):
+    user_problem = UserProblem.query.filter_by(user_id=current_user.id, problem_id=problem_id).first_or_404()
+    content = load_revision(user_problem.id, number)
+    if content is None:
+        abort(404)
+    return jsonify({"number": number, "code": content[0], "notes": content[1]})
+
+
+@main_bp.route("/problems/<int:problem_id>/revisions/<int:number>/restore", methods=["POST"])
+@login_required
+def restore_revision(problem_id, number):
+    user_problem = UserProblem.query.options(db.undefer_group("content")).filter_by(
+        user_id=current_user.id, problem_id=problem_id
+    ).first_or_404()
+    content = load_revision(user_problem.id, number)
+    if content is None:
+        abort(404)
+    if record_revision(user_problem, *content):
+        user_problem.last_saved_at = datetime.utcnow()
+        bump_stats(current_user.id, progress=True)
+        defer_activity(current_user.id, "restore_revision", "problem", problem_id, {"revision": number})
+        db.session.commit()
+        flash(f"Restored revision {number}.", "success")
+    else:
+        flash("That revision matches the current code.", "success")
+    return redirect(url_for("main.problem_detail", problem_id=problem_id))
+
+
+@main_bp.route("/problems/<int:problem_id>/run", methods=["POST"])
+@login_required
+def run_problem(problem_id):
+    _get_problem_or_404(problem_id)
+    user_problem = UserProblem.query.filter_by(user_id=current_user.id, problem_id=problem_id).first_or_404()
+    if not has_tests(problem_id):
+        return jsonify({"ok": False, "error": "This problem has no tests."}), 400
+    wait = ratelimit.check("run_user", current_user.id)
+    if wait:
+        return jsonify({"ok": False, "error": "Too many runs.", "retry_after": int(wait) + 1}), 429
+    payload = request.get_json(silent=True) or request.form
+    code = payload.get("code")
+    if not isinstance(code, str):
+        code = user_problem.code or ""
+    submission = submit(user_problem, code)
     db.session.commit()
-    flash("Saved.", "success")
-    return redirect(url_for("main.problem_detail", problem_id=problem.id))
+    if submission.status == "error":
+        return jsonify({"ok": False, "error": "Tests can't be run right now; try again later."}), 503
+    return jsonify(submission_json(submission)), 200 if submission.status == "done" else 202
+
+
+@main_bp.route("/problems/<int:problem_id>/submissions/<int:submission_id>")
+@login_required
+def submission_status(problem_id, submission_id):
+    submission = Submission.query.filter_by(
+        id=submission_id, user_id=current_user.id, problem_id=problem_id
+    ).first_or_404()
+    return jsonify(submission_json(submission))
 
 
 @main_bp.route("/problems/<int:problem_id>/time", methods=["POST"])
@@ -109,21 +292,208 @@ def add_time(problem_id):
     seconds = int(request.json.get("seconds", 0))
     if seconds <= 0:
         return jsonify({"ok": False}), 400
-    user_problem = UserProblem.query.filter_by(user_id=current_user.id, problem_id=problem_id).first()
-    if not user_problem:
-        user_problem = UserProblem(user_id=current_user.id, problem_id=problem_id)
-        db.session.add(user_problem)
-    user_problem.time_spent_sec += seconds
-    current_user.stats.total_time_sec += seconds
-    add_daily_time(current_user.id, seconds, date.today())
-    update_streak(current_user.stats, date.today())
-    db.session.add(ActivityLog(user_id=current_user.id, action="time_log", ref_type="problem", ref_id=problem_id))
+    if not catalog.problem(problem_id):
+        return jsonify({"ok": False}), 404
+    defer_time(current_user.id, [(problem_id, seconds)])
     db.session.commit()
     return jsonify({"ok": True})
 
 
+MAX_TIME_SAMPLES = 500
+
+
+@main_bp.route("/time", methods=["POST"])
+@login_required
+def add_time_batch():
+    # Accepts JSON or a form field, since navigator.sendBeacon cannot set headers
+    payload = request.get_json(silent=True)
+    if payload is None:
+        try:
+            payload = {"samples": json.loads(request.form.get("samples", "[]"))}
+        except json.JSONDecodeError:
+            return jsonify({"ok": False}), 400
+    if not isinstance(payload, dict):
+        return jsonify({"ok": False}), 400
+    samples = []
+    for item in (payload.get("samples") or [])[:MAX_TIME_SAMPLES]:
+        try:
+            sample = (int(item["problem_id"]), int(item["seconds"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if sample[1] > 0 and catalog.problem(sample[0]):
+            samples.append(sample)
+    logged = sum(seconds for _, seconds in samples)
+    if not logged:
+        return jsonify({"ok": False}), 400
+    defer_time(current_user.id, samples)
+    db.session.commit()
+    return jsonify({"ok": True, "seconds": logged})
+
+
+FIRST_STATS_YEAR = 2000
+
+
+def _stats_year():
+    year = request.args.get("year", type=int) or date.today().year
+    if not FIRST_STATS_YEAR <= year <= date.today().year:
+        abort(404)
+    return year
+
+
 @main_bp.route("/stats")
 @login_required
 def stats():
     stats = current_user.stats
-    return render_template("stats.html", stats=stats)
+    series = activity_series(stats, _stats_year())
+    return render_template(
+        "stats.html", stats=stats, series=series, tag_progress=tag_completion(current_user.id),
+        has_prev_year=series["year"] > FIRST_STATS_YEAR, has_next_year=series["year"] < date.today().year,
+    )
+
+
+@main_bp.route("/stats/activity.json")
+@login_required
+def stats_activity():
+    return jsonify(activity_series(current_user.stats, _stats_year()))
+
+
+@main_bp.route("/leaderboard")
+@login_required
+def leaderboard():
+    kind = request.args.get("board", "global")
+    chapter = None
+    if kind == "chapter":
+        chapter = catalog.chapter_by_slug(request.args.get("chapter", ""))
+        if not chapter:
+            abort(404)
+    board = board_key(kind, chapter.id if chapter else None)
+
+    after = None
+    if request.args.get("after"):
+        try:
+            score, user_id = request.args["after"].split(":", 1)
+            after = (int(score), int(user_id))
+        except ValueError:
+            abort(400)
+
+    entries = page(board, after)
+    my_rank, my_score = rank_of(board, current_user.id)
+    next_cursor = None
+    if len(entries) == PAGE_SIZE:
+        last = entries[-1][1]
+        next_cursor = f"{last.score}:{last.user_id}"
+    return render_template(
+        "leaderboard.html",
+        kind=kind,
+        chapter=chapter,
+        chapters=catalog.chapters(),
+        entries=entries,
+        my_rank=my_rank,
+        my_score=my_score,
+        next_cursor=next_cursor,
+    )
+
+
+def _search_results():
+    query = request.args.get("q", "").strip()
+    chapter = catalog.chapter_by_slug(request.args.get("chapter", ""))
+    after = None
+    if request.args.get("after"):
+        try:
+            score, problem_id = request.args["after"].rsplit(":", 1)
+            after = (int(score), int(problem_id))
+        except ValueError:
+            abort(400)
+    rows = search(
+        query,
+        current_user.id,
+        difficulty=request.args.get("difficulty") or None,
+        chapter_id=chapter.id if chapter else None,
+        status=request.args.get("status") or None,
+        after=after,
+    )
+    results = [(catalog.problem(row.id), row.status or "unsolved") for row in rows]
+    next_cursor = f"{rows[-1].score}:{rows[-1].id}" if len(rows) == SEARCH_PAGE_SIZE else None
+    return query, [r for r in results if r[0]], next_cursor
+
+
+@main_bp.route("/search")
+@login_required
+def search_problems():
+    query, results, next_cursor = _search_results()
+    return render_template(
+        "search.html",
+        query=query,
+        results=results,
+        next_cursor=next_cursor,
+        chapters=catalog.chapters(),
+        args=request.args,
+    )
+
+
+@main_bp.route("/search.json")
+@login_required
+def search_problems_json():
+    query, results, next_cursor = _search_results()
+    return jsonify({
+        "query": query,
+        "next": next_cursor,
+        "results": [
+            {
+                "id": p.id,
+                "title": p.title,
+                "chapter": catalog.chapter(p.chapter_id).slug,
+                "difficulty": p.difficulty,
+                "points": p.points,
+                "tags": list(p.tags),
+                "status": status,
+            }
+            for p, status in results
+        ],
+    })
+
+
+def _recommendation():
+    chapter = catalog.chapter_by_slug(request.args.get("chapter", ""))
+    tags = [t.strip().lower() for t in request.args.get("tags", "").split(",") if t.strip()]
+    return next_problem(
+        current_user.id,
+        tags=tags,
+        difficulty=request.args.get("difficulty") or None,
+        chapter_id=chapter.id if chapter else None,
+        include_attempted=request.args.get("attempted") == "true",
+    )
+
+
+@main_bp.route("/next")
+@login_required
+def next_unsolved():
+    problem = _recommendation()
+    if not problem:
+        flash("Nothing left to solve with those filters.", "success")
+        return redirect(url_for("main.dashboard"))
+    return redirect(url_for("main.problem_detail", problem_id=problem.id))
+
+
+@main_bp.route("/recommendations.json")
+@login_required
+def recommendations():
+    problem = _recommendation()
+    return jsonify({
+        "next": problem and {
+            "id": problem.id,
+            "title": problem.title,
+            "difficulty": problem.difficulty,
+            "tags": list(problem.tags),
+        },
+        "tags": [
+            {"tag": tag, "solved": solved, "total": total}
+            for tag, solved, total in tag_completion(current_user.id)
+        ],
+    })
+
+
+@main_bp.route("/export/<dataset>.<fmt>")
+@login_required
+def export_data(dataset, fmt):
+    return export_response(dataset, fmt, user_id=current_user.id)
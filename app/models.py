@@ -1,5 +1,4 @@
 from datetime import datetime, date
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from .extensions import db
 
@@ -11,26 +10,37 @@ class AppSetting(db.Model):
 
     @staticmethod
     def get_value(key, default=None):
-        setting = AppSetting.query.get(key)
-        if not setting:
-            return default
-        return setting.value
+        from .catalog import catalog
+        return catalog.setting(key, default)
 
     @staticmethod
     def set_value(key, value):
+        from .utils import bump_catalog_version
         setting = AppSetting.query.get(key)
         if not setting:
             setting = AppSetting(key=key, value=str(value))
             db.session.add(setting)
         else:
             setting.value = str(value)
+        bump_catalog_version()
         db.session.commit()
 
 
+class CatalogVersion(db.Model):
+    # Single row bumped by every catalog/settings write; workers compare it
+    # against the version their in-process catalog cache was built from.
+    __tablename__ = "catalog_version"
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class User(UserMixin, db.Model):
     __tablename__ = "users"
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(255), unique=True, nullable=False)
+    # Shown on public pages instead of anything derived from the email
+    display_name = db.Column(db.String(40), nullable=True)
     password_hash = db.Column(db.String(255), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -38,10 +48,12 @@ class User(UserMixin, db.Model):
     stats = db.relationship("UserStats", backref="user", uselist=False, cascade="all, delete-orphan")
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        from .passwords import hash_password
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        from .passwords import verify_password
+        return verify_password(self.password_hash, password)
 
 
 class UserStats(db.Model):
@@ -53,6 +65,19 @@ class UserStats(db.Model):
     current_streak = db.Column(db.Integer, default=0)
     longest_streak = db.Column(db.Integer, default=0)
     last_activity_date = db.Column(db.Date, nullable=True)
+    # Bumped whenever anything shown on the user's problem/chapter pages changes
+    progress_version = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    progress_updated_at = db.Column(db.DateTime, nullable=True)
+
+
+class LeaderboardScore(db.Model):
+    __tablename__ = "leaderboard_scores"
+    # "global", "week:<iso-year>-<iso-week>" or "chapter:<chapter_id>"
+    board = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    score = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (db.Index("ix_leaderboard_board_score", "board", "score", "user_id"),)
 
 
 class Chapter(db.Model):
@@ -61,10 +86,18 @@ class Chapter(db.Model):
     title = db.Column(db.String(120), nullable=False)
     slug = db.Column(db.String(120), unique=True, nullable=False)
     position = db.Column(db.Integer, default=0)
+    problem_count = db.Column(db.Integer, default=0, server_default="0", nullable=False)
 
     problems = db.relationship("Problem", backref="chapter", cascade="all, delete-orphan")
 
 
+class ChapterProgress(db.Model):
+    __tablename__ = "chapter_progress"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    chapter_id = db.Column(db.Integer, db.ForeignKey("chapters.id"), primary_key=True)
+    solved = db.Column(db.Integer, default=0, nullable=False)
+
+
 class Tag(db.Model):
     __tablename__ = "tags"
     id = db.Column(db.Integer, primary_key=True)
@@ -84,7 +117,10 @@ class Problem(db.Model):
     title = db.Column(db.String(200), nullable=False)
     difficulty = db.Column(db.String(32), nullable=False)
     points = db.Column(db.Integer, default=10)
-    prompt = db.Column(db.Text, default="")
+    # Only the problem page needs the prompt; list views never load it
+    prompt = db.deferred(db.Column(db.Text, default=""))
+    # Bumped whenever the problem's test cases change; part of the run cache key
+    tests_version = db.Column(db.Integer, default=0, server_default="0", nullable=False)
 
     tags = db.relationship("Tag", secondary="problem_tags", backref="problems")
 
@@ -95,18 +131,44 @@ class UserProblem(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     problem_id = db.Column(db.Integer, db.ForeignKey("problems.id"), nullable=False)
     status = db.Column(db.String(20), default="unsolved")
-    code = db.Column(db.Text, default="")
-    notes = db.Column(db.Text, default="")
+    # Loaded together on first access, or up front with undefer_group("content")
+    code = db.deferred(db.Column(db.Text, default=""), group="content")
+    notes = db.deferred(db.Column(db.Text, default=""), group="content")
     attempts = db.Column(db.Integer, default=0)
     time_spent_sec = db.Column(db.Integer, default=0)
     last_opened_at = db.Column(db.DateTime, nullable=True)
     last_saved_at = db.Column(db.DateTime, nullable=True)
     solved_at = db.Column(db.DateTime, nullable=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    revision = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    content_hash = db.Column(db.String(64), nullable=True)
 
     user = db.relationship("User", backref="user_problems")
     problem = db.relationship("Problem", backref="user_problems")
 
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "problem_id", name="uq_user_problem"),
+        db.Index("ix_user_problems_user_solved", "user_id", "solved_at"),
+        db.Index("ix_user_problems_updated_at", "updated_at"),
+    )
+
+
+class CodeRevision(db.Model):
+    __tablename__ = "code_revisions"
+    id = db.Column(db.Integer, primary_key=True)
+    user_problem_id = db.Column(db.Integer, db.ForeignKey("user_problems.id"), nullable=False)
+    number = db.Column(db.Integer, nullable=False)
+    # Snapshots hold full code/notes, the rest a line delta against number - 1
+    is_snapshot = db.Column(db.Boolean, default=False, nullable=False)
+    # Autosaves within AUTOSAVE_COALESCE_SECONDS rewrite this row instead of adding one
+    is_autosave = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint("user_problem_id", "number", name="uq_code_revision"),)
+
 
 class ActivityLog(db.Model):
     __tablename__ = "activity_log"
@@ -118,6 +180,21 @@ class ActivityLog(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     meta_json = db.Column(db.Text, default="{}")
 
+    __table_args__ = (
+        db.Index("ix_activity_log_user_created", "user_id", "created_at"),
+        db.Index("ix_activity_log_action_created", "action", "created_at"),
+        db.Index("ix_activity_log_created_at", "created_at"),
+    )
+
+
+class ActivityRollup(db.Model):
+    __tablename__ = "activity_rollup"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    action = db.Column(db.String(64), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    seconds = db.Column(db.Integer, default=0, nullable=False)
+
 
 class DailyTime(db.Model):
     __tablename__ = "daily_time"
@@ -126,4 +203,102 @@ class DailyTime(db.Model):
     day = db.Column(db.Date, default=date.today, nullable=False)
     seconds = db.Column(db.Integer, default=0)
 
-    __table_args__ = (db.UniqueConstraint("user_id", "day", name="uq_daily_time"),)
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "day", name="uq_daily_time"),
+        # Covers the per-user calendar range scan without touching the heap
+        db.Index("ix_daily_time_user_day_seconds", "user_id", "day", "seconds"),
+    )
+
+
+class ProblemSummary(db.Model):
+    # Refreshed by `flask refresh-analytics`; see analytics.py
+    __tablename__ = "problem_summary"
+    problem_id = db.Column(db.Integer, db.ForeignKey("problems.id"), primary_key=True)
+    started = db.Column(db.Integer, default=0, nullable=False)
+    solved = db.Column(db.Integer, default=0, nullable=False)
+    abandoned = db.Column(db.Integer, default=0, nullable=False)
+    solve_rate = db.Column(db.Float, default=0.0, nullable=False)
+    median_solve_sec = db.Column(db.Integer, nullable=True)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index("ix_problem_summary_solve_rate", "solve_rate"),)
+
+
+class DailyActiveUsers(db.Model):
+    __tablename__ = "daily_active_users"
+    day = db.Column(db.Date, primary_key=True)
+    users = db.Column(db.Integer, default=0, nullable=False)
+
+
+class AnalyticsWatermark(db.Model):
+    __tablename__ = "analytics_watermarks"
+    name = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.DateTime, nullable=False)
+
+
+class Job(db.Model):
+    # Durable background work; see jobs.py
+    __tablename__ = "jobs"
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, default="{}", nullable=False)
+    status = db.Column(db.String(16), default="queued", nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(64), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index("ix_jobs_status_run_at", "status", "run_at"),)
+
+
+class ProblemTest(db.Model):
+    __tablename__ = "problem_tests"
+    id = db.Column(db.Integer, primary_key=True)
+    problem_id = db.Column(db.Integer, db.ForeignKey("problems.id"), nullable=False)
+    position = db.Column(db.Integer, default=0, nullable=False)
+    input = db.Column(db.Text, default="", nullable=False)
+    expected = db.Column(db.Text, default="", nullable=False)
+    # Hidden tests report pass/fail only
+    is_hidden = db.Column(db.Boolean, default=False, nullable=False)
+
+    __table_args__ = (db.Index("ix_problem_tests_problem_position", "problem_id", "position"),)
+
+
+class RunResult(db.Model):
+    # Cached outcome of running some code against one version of a problem's tests
+    __tablename__ = "run_results"
+    id = db.Column(db.Integer, primary_key=True)
+    problem_id = db.Column(db.Integer, db.ForeignKey("problems.id"), nullable=False)
+    tests_version = db.Column(db.Integer, nullable=False)
+    code_hash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(16), nullable=False)
+    passed = db.Column(db.Boolean, default=False, nullable=False)
+    details = db.Column(db.Text, default="[]", nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint("problem_id", "tests_version", "code_hash", name="uq_run_result"),
+    )
+
+
+class Submission(db.Model):
+    __tablename__ = "submissions"
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    problem_id = db.Column(db.Integer, db.ForeignKey("problems.id"), nullable=False)
+    # Status polling doesn't need the code; the run_code job undefers it
+    code = db.deferred(db.Column(db.Text, default="", nullable=False))
+    code_hash = db.Column(db.String(64), nullable=False)
+    tests_version = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(16), default="queued", nullable=False)
+    passed = db.Column(db.Boolean, nullable=True)
+    # Award the solve if this run passes ("Mark solved" rather than "Run tests")
+    award = db.Column(db.Boolean, default=False, nullable=False)
+    result_id = db.Column(db.Integer, db.ForeignKey("run_results.id"), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index("ix_submissions_user_problem", "user_id", "problem_id", "created_at"),)
@@ -0,0 +1,109 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+from threading import BoundedSemaphore, Lock
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HashingBusy(RuntimeError):
+    # Too many hashes already queued; callers should answer 503
+    pass
+
+
+# Password hashing is deliberately slow, so it runs in a small process pool
+# instead of on the request thread. At most PASSWORD_HASH_WORKERS hashes run
+# at once and PASSWORD_HASH_QUEUE more may wait; anything beyond that is
+# refused immediately rather than piling up behind a login storm. A slot is
+# only freed when its hash actually finishes, even if the caller gave up.
+
+_lock = Lock()
+_pool = None  # (pid, executor, semaphore)
+
+
+def _executor():
+    global _pool
+    workers = current_app.config.get("PASSWORD_HASH_WORKERS", 1)
+    if workers <= 0:
+        return None, None
+    with _lock:
+        # A pool inherited through fork belongs to the parent process
+        if _pool is None or _pool[0] != os.getpid():
+            slots = workers + current_app.config.get("PASSWORD_HASH_QUEUE", 8)
+            # forkserver, not fork: this runs on a request thread, and forking a
+            # threaded process can leave the child stuck on a lock (logging, the
+            # DB pool) some other thread held. Children fork from a clean,
+            # single-threaded server that only has werkzeug.security loaded.
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["werkzeug.security"])
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool = (os.getpid(), executor, BoundedSemaphore(slots))
+        return _pool[1], _pool[2]
+
+
+def _discard(executor):
+    # A hashing child died (OOM kill, crash) and took the executor with it;
+    # drop it so the next call starts a fresh pool
+    global _pool
+    with _lock:
+        if _pool is not None and _pool[1] is executor:
+            _pool = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(executor, slots, fn, args):
+    if not slots.acquire(blocking=False):
+        raise HashingBusy("Password hashing queue is full.")
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=current_app.config.get("PASSWORD_HASH_TIMEOUT", 10))
+    except FutureTimeout:
+        raise HashingBusy("Password hashing timed out.")
+
+
+def _call(fn, *args):
+    for _ in range(2):
+        executor, slots = _executor()
+        if executor is None:
+            return fn(*args)
+        try:
+            return _run(executor, slots, fn, args)
+        except BrokenProcessPool:
+            _discard(executor)
+    raise HashingBusy("Password hashing pool keeps failing.")
+
+
+def hash_password(password):
+    return _call(generate_password_hash, password, current_app.config["PASSWORD_HASH_METHOD"])
+
+
+def verify_password(password_hash, password):
+    return _call(check_password_hash, password_hash, password)
+
+
+def _parse_method(method):
+    # Werkzeug method strings with its defaults filled in, so "scrypt" and
+    # "scrypt:32768:8:1" compare equal
+    name, *params = method.split(":")
+    if name == "scrypt":
+        n, r, p = params + ["32768", "8", "1"][len(params):]
+        return name, (int(n), int(r), int(p))
+    if name == "pbkdf2":
+        hash_name, iterations = params + ["sha256", str(DEFAULT_PBKDF2_ITERATIONS)][len(params):]
+        return name, (hash_name, int(iterations))
+    return name, tuple(params)
+
+
+def needs_rehash(password_hash):
+    # Stored hashes look like "<method>$<salt>$<hash>"; werkzeug always writes
+    # the full method, including the cost parameters
+    try:
+        return _parse_method(password_hash.split("$", 1)[0]) != _parse_method(current_app.config["PASSWORD_HASH_METHOD"])
+    except ValueError:
+        return True
@@ -0,0 +1,52 @@
+from threading import Lock
+import time
+from flask import current_app
+
+
+class TokenBucketLimiter:
+    # Per-worker token buckets keyed by (name, key). Each bucket holds up to
+    # `capacity` tokens and refills continuously over `period` seconds.
+
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._lock = Lock()
+        self._buckets = {}
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def hit(self, name, key, capacity, period):
+        # Takes a token; returns 0 when allowed, otherwise seconds until one is available
+        rate = capacity / period
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get((name, key), (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._buckets[(name, key)] = (tokens, now)
+                return (1 - tokens) / rate
+            self._buckets[(name, key)] = (tokens - 1, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+            return 0
+
+    def _prune(self, now):
+        # Drop buckets that have refilled completely; they're equivalent to new ones
+        limits = current_app.config.get("RATE_LIMITS", {})
+        for (name, key), (tokens, updated) in list(self._buckets.items()):
+            capacity, period = limits.get(name, (1, 0))
+            if tokens + (now - updated) * capacity / max(period, 1e-9) >= capacity:
+                del self._buckets[(name, key)]
+
+
+limiter = TokenBucketLimiter()
+
+
+def check(name, key):
+    # Seconds to wait if `key` is over the RATE_LIMITS[name] budget, else 0
+    limit = current_app.config.get("RATE_LIMITS", {}).get(name)
+    if not limit or not key:
+        return 0
+    return limiter.hit(name, key, *limit)
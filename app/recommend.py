@@ -0,0 +1,97 @@
+from threading import Lock
+from .catalog import catalog
+from .extensions import db
+from .models import UserProblem
+
+
+# Problems are numbered by catalog order (chapter position, then id) and
+# every filter is a Python int used as a bitset over those positions, so
+# "first unsolved problem matching X" is a few ANDs and a lowest-set-bit.
+
+_lock = Lock()
+_index = None
+
+
+class ProblemBitsets:
+    def __init__(self, chapters, chapter_problems):
+        self.problems = []
+        self.position = {}
+        self.tags = {}
+        self.difficulties = {}
+        self.chapters = {}
+        for chapter in chapters:
+            chapter_bits = 0
+            for problem in chapter_problems(chapter.id):
+                bit = 1 << len(self.problems)
+                self.position[problem.id] = len(self.problems)
+                self.problems.append(problem)
+                chapter_bits |= bit
+                self.difficulties[problem.difficulty] = self.difficulties.get(problem.difficulty, 0) | bit
+                for tag in problem.tags:
+                    self.tags[tag] = self.tags.get(tag, 0) | bit
+            self.chapters[chapter.id] = chapter_bits
+        self.all = (1 << len(self.problems)) - 1
+
+    def bits_for(self, problem_ids):
+        bits = 0
+        for problem_id in problem_ids:
+            position = self.position.get(problem_id)
+            if position is not None:
+                bits |= 1 << position
+        return bits
+
+    def first(self, bits):
+        if not bits:
+            return None
+        return self.problems[(bits & -bits).bit_length() - 1]
+
+
+def problem_bitsets():
+    global _index
+    chapters = catalog.chapters()
+    version = catalog.version
+    with _lock:
+        if _index is None or _index[0] != version:
+            _index = (version, ProblemBitsets(chapters, catalog.chapter_problems))
+        return _index[1]
+
+
+def user_bitsets(index, user_id):
+    # (solved, attempted) bitsets from the user's progress rows
+    solved, attempted = [], []
+    for problem_id, status in db.session.execute(
+        db.select(UserProblem.problem_id, UserProblem.status).where(UserProblem.user_id == user_id)
+    ):
+        if status == "solved":
+            solved.append(problem_id)
+        elif status == "attempted":
+            attempted.append(problem_id)
+    return index.bits_for(solved), index.bits_for(attempted)
+
+
+def next_problem(user_id, tags=(), difficulty=None, chapter_id=None, include_attempted=False):
+    index = problem_bitsets()
+    solved, attempted = user_bitsets(index, user_id)
+    candidates = index.all & ~solved
+    if not include_attempted:
+        candidates &= ~attempted
+    if tags:
+        tag_bits = 0
+        for tag in tags:
+            tag_bits |= index.tags.get(tag, 0)
+        candidates &= tag_bits
+    if difficulty:
+        candidates &= index.difficulties.get(difficulty, 0)
+    if chapter_id:
+        candidates &= index.chapters.get(chapter_id, 0)
+    return index.first(candidates)
+
+
+def tag_completion(user_id):
+    # [(tag, solved, total)] sorted by tag name
+    index = problem_bitsets()
+    solved, _ = user_bitsets(index, user_id)
+    return [
+        (tag, (bits & solved).bit_count(), bits.bit_count())
+        for tag, bits in sorted(index.tags.items())
+    ]
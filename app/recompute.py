@@ -0,0 +1,85 @@
+from collections import defaultdict
+from flask import current_app
+from .extensions import db
+from .leaderboard import rebuild as rebuild_boards
+from .models import DailyTime, Problem, UserProblem, UserStats
+from .utils import level_from_xp
+
+
+FIELDS = ("xp", "level", "total_time_sec", "current_streak", "longest_streak", "last_activity_date")
+
+
+def streaks(days):
+    # days must be sorted; returns (current, longest, last_day) over consecutive runs
+    current = longest = 0
+    previous = None
+    for day in days:
+        ordinal = day.toordinal()
+        current = current + 1 if previous is not None and ordinal - previous == 1 else 1
+        longest = max(longest, current)
+        previous = ordinal
+    return current, longest, days[-1] if days else None
+
+
+def _chunk_stats(lo, hi):
+    in_chunk = UserStats.user_id.between(lo, hi)
+    current = {row.user_id: row for row in db.session.execute(
+        db.select(UserStats.user_id, *(getattr(UserStats, f) for f in FIELDS)).where(in_chunk)
+    )}
+    xp = dict(db.session.execute(
+        db.select(UserProblem.user_id, db.func.sum(Problem.points))
+        .join(Problem, Problem.id == UserProblem.problem_id)
+        .where(UserProblem.status == "solved", UserProblem.user_id.between(lo, hi))
+        .group_by(UserProblem.user_id)
+    ).all())
+    time = dict(db.session.execute(
+        db.select(DailyTime.user_id, db.func.sum(DailyTime.seconds))
+        .where(DailyTime.user_id.between(lo, hi))
+        .group_by(DailyTime.user_id)
+    ).all())
+    days = defaultdict(list)
+    for user_id, day in db.session.execute(
+        db.select(DailyTime.user_id, DailyTime.day)
+        .where(DailyTime.user_id.between(lo, hi), DailyTime.seconds > 0)
+        .order_by(DailyTime.user_id, DailyTime.day)
+    ):
+        days[user_id].append(day)
+
+    for user_id, old in current.items():
+        user_xp = int(xp.get(user_id) or 0)
+        current_streak, longest_streak, last_day = streaks(days[user_id])
+        new = {
+            "xp": user_xp,
+            "level": level_from_xp(user_xp),
+            "total_time_sec": int(time.get(user_id) or 0),
+            "current_streak": current_streak,
+            "longest_streak": longest_streak,
+            "last_activity_date": last_day,
+        }
+        changed = {f: (getattr(old, f), new[f]) for f in FIELDS if getattr(old, f) != new[f]}
+        if changed:
+            yield user_id, new, changed
+
+
+def recompute_stats(chunk_size=1000, dry_run=False, report=None):
+    # Returns {field: number of users whose value changed}
+    ids = db.session.execute(db.select(UserStats.user_id).order_by(UserStats.user_id)).scalars().all()
+    changed_fields = defaultdict(int)
+    weeks = current_app.config.get("LEADERBOARD_WEEKS_TO_KEEP") or 8
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        updates = []
+        for user_id, new, changed in _chunk_stats(chunk[0], chunk[-1]):
+            updates.append({"user_id": user_id, **new})
+            for field in changed:
+                changed_fields[field] += 1
+            if report:
+                report(user_id, changed)
+        if not dry_run:
+            if updates:
+                db.session.execute(db.update(UserStats), updates)
+            # Boards are derived from the same xp and solves, so they change in
+            # the same transaction and can't drift from the profile numbers
+            rebuild_boards(weeks, user_range=(chunk[0], chunk[-1]), commit=False)
+            db.session.commit()
+    return dict(changed_fields)
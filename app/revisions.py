@@ -0,0 +1,169 @@
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+import hashlib
+import json
+import zlib
+from .extensions import db
+from .models import CodeRevision
+
+
+# A full snapshot every N revisions bounds how many deltas a restore replays
+SNAPSHOT_EVERY = 20
+
+
+def normalize_newlines(text: str) -> str:
+    # Browsers submit CRLF but textarea values (and so autosave offsets) use LF
+    return (text or "").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def content_hash(code: str, notes: str) -> str:
+    return hashlib.sha256(f"{code or ''}\0{notes or ''}".encode("utf-8")).hexdigest()
+
+
+def _diff(old: str, new: str):
+    # Line-level delta: ["c", i1, i2] copies old lines, ["i", text] inserts text
+    old_lines = (old or "").splitlines(keepends=True)
+    new_lines = (new or "").splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append(["c", i1, i2])
+        elif tag in ("replace", "insert"):
+            ops.append(["i", "".join(new_lines[j1:j2])])
+    return ops
+
+
+def _patch(old: str, ops) -> str:
+    old_lines = (old or "").splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if op[0] == "c":
+            parts.extend(old_lines[op[1]:op[2]])
+        else:
+            parts.append(op[1])
+    return "".join(parts)
+
+
+def apply_splices(text: str, splices) -> str:
+    # Each splice replaces text[start:end] (code point offsets) with "text"
+    text = text or ""
+    for splice in splices or []:
+        start, end, insert = int(splice["start"]), int(splice["end"]), str(splice.get("text", ""))
+        if not 0 <= start <= end <= len(text):
+            raise ValueError("Splice out of range.")
+        text = text[:start] + insert + text[end:]
+    return text
+
+
+def _encode(payload) -> bytes:
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(blob: bytes):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def base_hash(user_problem) -> str:
+    # What an autosave's splices must have been computed against
+    return content_hash(normalize_newlines(user_problem.code), normalize_newlines(user_problem.notes))
+
+
+def record_revision(user_problem, code: str, notes: str, autosave_window: int = 0) -> bool:
+    # Stores code/notes as a new revision; returns False when nothing changed.
+    # With autosave_window, an autosave less than that many seconds after the
+    # newest revision was started (itself an autosave) replaces it.
+    code, notes = normalize_newlines(code), normalize_newlines(notes)
+    new_hash = content_hash(code, notes)
+    old_hash = user_problem.content_hash or content_hash(user_problem.code, user_problem.notes)
+    if new_hash == old_hash:
+        return False
+
+    latest = None
+    if autosave_window and user_problem.revision:
+        latest = db.session.execute(
+            db.select(CodeRevision).where(
+                CodeRevision.user_problem_id == user_problem.id,
+                CodeRevision.number == user_problem.revision,
+                CodeRevision.is_autosave.is_(True),
+                CodeRevision.created_at >= datetime.utcnow() - timedelta(seconds=autosave_window),
+            )
+        ).scalar_one_or_none()
+
+    if latest is not None:
+        number, snapshot = latest.number, latest.is_snapshot
+        previous = None if snapshot else load_revision(user_problem.id, number - 1)
+        if previous is None:
+            snapshot = True
+    else:
+        number = (user_problem.revision or 0) + 1
+        snapshot = not user_problem.revision or number % SNAPSHOT_EVERY == 1
+        previous = (user_problem.code, user_problem.notes)
+    if snapshot:
+        payload = {"code": code, "notes": notes}
+    else:
+        payload = {"code": _diff(previous[0], code), "notes": _diff(previous[1], notes)}
+    blob = _encode(payload)
+
+    if latest is not None:
+        latest.is_snapshot = snapshot
+        latest.content_hash = new_hash
+        latest.payload = blob
+        latest.size = len(blob)
+    else:
+        db.session.add(CodeRevision(
+            user_problem_id=user_problem.id,
+            number=number,
+            is_snapshot=snapshot,
+            is_autosave=bool(autosave_window),
+            content_hash=new_hash,
+            payload=blob,
+            size=len(blob),
+        ))
+    user_problem.code = code
+    user_problem.notes = notes
+    user_problem.revision = number
+    user_problem.content_hash = new_hash
+    return True
+
+
+def list_revisions(user_problem_id: int, limit: int = 50):
+    return db.session.execute(
+        db.select(
+            CodeRevision.number, CodeRevision.created_at, CodeRevision.size, CodeRevision.is_snapshot,
+            CodeRevision.is_autosave, CodeRevision.content_hash,
+        )
+        .where(CodeRevision.user_problem_id == user_problem_id)
+        .order_by(CodeRevision.number.desc())
+        .limit(limit)
+    ).all()
+
+
+def load_revision(user_problem_id: int, number: int):
+    # Returns (code, notes) for a revision, replaying deltas from the nearest snapshot
+    base = db.session.execute(
+        db.select(db.func.max(CodeRevision.number)).where(
+            CodeRevision.user_problem_id == user_problem_id,
+            CodeRevision.is_snapshot.is_(True),
+            CodeRevision.number <= number,
+        )
+    ).scalar()
+    if base is None:
+        return None
+    rows = db.session.execute(
+        db.select(CodeRevision.number, CodeRevision.is_snapshot, CodeRevision.payload)
+        .where(
+            CodeRevision.user_problem_id == user_problem_id,
+            CodeRevision.number.between(base, number),
+        )
+        .order_by(CodeRevision.number.asc())
+    ).all()
+    if not rows or rows[-1].number != number:
+        return None
+    code = notes = ""
+    for row in rows:
+        payload = _decode(row.payload)
+        if row.is_snapshot:
+            code, notes = payload["code"], payload["notes"]
+        else:
+            code, notes = _patch(code, payload["code"]), _patch(notes, payload["notes"])
+    return code, notes
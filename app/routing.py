@@ -0,0 +1,121 @@
+import random
+from threading import Lock
+import time
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.expression import Select
+
+
+# Optional read replicas, configured as SQLALCHEMY_BINDS "replica_<n>".
+# On GET/HEAD requests, SELECTs go to a healthy replica; anything else
+# (flushes, INSERT/UPDATE/DELETE, raw connections) goes to the primary,
+# and once a request has written, the rest of it stays on the primary.
+# A write also pins the browser session to the primary for
+# REPLICA_STICKY_SECONDS so the next page reads its own writes.
+
+REPLICA_PREFIX = "replica_"
+STICKY_KEY = "_db_primary_until"
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def _is_read(clause):
+    if isinstance(clause, Select):
+        return True
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip()[:6].upper() == "SELECT"
+    return False
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or (clause is not None and not _is_read(clause)):
+                g.db_route = "primary"
+                g.db_wrote = True
+            elif clause is not None and g.get("db_route") == "replica":
+                engine = replicas.pick(self._db)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaSet:
+    # Per-worker replica health. A replica is probed with SELECT 1 at most
+    # every REPLICA_CHECK_SECONDS, and taken out of rotation on a failed
+    # probe or a connection error until the next probe succeeds.
+
+    def __init__(self):
+        self._lock = Lock()
+        self._health = {}  # name -> (healthy, checked_at)
+        self.check_interval = 10.0
+
+    def names(self, db):
+        return sorted(name for name in db.engines if name and name.startswith(REPLICA_PREFIX))
+
+    def mark_down(self, name):
+        with self._lock:
+            self._health[name] = (False, time.monotonic())
+
+    def healthy(self, name, engine):
+        now = time.monotonic()
+        state = self._health.get(name)
+        if state and now - state[1] < self.check_interval:
+            return state[0]
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            ok = True
+        except SQLAlchemyError:
+            ok = False
+        with self._lock:
+            self._health[name] = (ok, now)
+        return ok
+
+    def pick(self, db):
+        names = self.names(db)
+        random.shuffle(names)
+        for name in names:
+            engine = db.engines[name]
+            if self.healthy(name, engine):
+                return engine
+        return None
+
+    def status(self, db):
+        return {name: self.healthy(name, db.engines[name]) for name in self.names(db)}
+
+
+replicas = ReplicaSet()
+
+
+def use_primary():
+    # The rest of this request reads from the primary, e.g. before a GET
+    # creates a row that a lagging replica might not show yet
+    if has_request_context():
+        g.db_route = "primary"
+
+
+def init_app(app, db):
+    replicas.check_interval = app.config.get("REPLICA_CHECK_SECONDS", 10)
+    with app.app_context():
+        names = replicas.names(db)
+        for name in names:
+            def _on_error(context, name=name):
+                if context.is_disconnect or context.connection is None:
+                    replicas.mark_down(name)
+            event.listen(db.engines[name], "handle_error", _on_error)
+    if not names:
+        return
+
+    @app.before_request
+    def _route_reads():
+        if request.method in READ_METHODS and session.get(STICKY_KEY, 0) < time.time():
+            g.db_route = "replica"
+
+    @app.after_request
+    def _stick_after_write(response):
+        if g.get("db_wrote"):
+            session[STICKY_KEY] = time.time() + app.config.get("REPLICA_STICKY_SECONDS", 5)
+        return response
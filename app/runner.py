@@ -0,0 +1,190 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+import hashlib
+import json
+import logging
+from flask import current_app
+from .extensions import db
+from .jobs import enqueue, handler
+from .models import Problem, ProblemTest, RunResult, Submission, UserProblem
+from .sandbox import SandboxUnavailable, pool
+from .tasks import defer_activity, defer_board_scores
+from .utils import bump_stats, record_solve, upsert
+
+
+# Submissions are checked by the `run_code` job, so web workers only record
+# the submission and return. Results are cached in run_results per
+# (problem, tests_version, code hash): resubmitting the same code against the
+# same tests finishes immediately without running anything. Submissions that
+# can't be run at all end as "error" rather than staying queued.
+
+log = logging.getLogger(__name__)
+
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256((code or "").encode("utf-8")).hexdigest()
+
+
+def _normalize(output: str) -> str:
+    return "\n".join(line.rstrip() for line in (output or "").strip().splitlines())
+
+
+def has_tests(problem_id) -> bool:
+    return db.session.execute(
+        db.select(ProblemTest.id).where(ProblemTest.problem_id == problem_id).limit(1)
+    ).first() is not None
+
+
+def award_solve(user_problem, problem, bump=True):
+    # XP is granted once per problem, matching recompute_stats. With
+    # bump=False the caller folds the XP into its own bump_stats call.
+    if user_problem.status == "solved":
+        return False
+    record_solve(user_problem.user_id, problem.chapter_id)
+    user_problem.status = "solved"
+    user_problem.solved_at = datetime.utcnow()
+    defer_board_scores(user_problem.user_id, problem.points, problem.chapter_id)
+    defer_activity(user_problem.user_id, "solve_problem", "problem", problem.id)
+    if bump:
+        bump_stats(user_problem.user_id, xp=problem.points, today=date.today(), progress=True)
+    return True
+
+
+def submit(user_problem, code, award=False):
+    problem_id = user_problem.problem_id
+    tests_version = db.session.execute(
+        db.select(Problem.tests_version).where(Problem.id == problem_id)
+    ).scalar()
+    db.session.execute(
+        db.update(UserProblem)
+        .where(UserProblem.id == user_problem.id)
+        .values(attempts=db.func.coalesce(UserProblem.attempts, 0) + 1)
+    )
+    submission = Submission(
+        user_id=user_problem.user_id,
+        problem_id=problem_id,
+        code=code,
+        code_hash=code_hash(code),
+        tests_version=tests_version,
+        award=award,
+    )
+    db.session.add(submission)
+    db.session.flush()
+    cached = db.session.execute(
+        db.select(RunResult).where(
+            RunResult.problem_id == problem_id,
+            RunResult.tests_version == tests_version,
+            RunResult.code_hash == submission.code_hash,
+            # Timeouts and crashes may be load related, so those run again
+            RunResult.status.in_(("passed", "failed")),
+        )
+    ).scalar_one_or_none()
+    if cached is not None:
+        _finish(submission, cached)
+    else:
+        enqueue("run_code", {"submission_id": submission.id})
+    return submission
+
+
+def _finish(submission, result):
+    submission.status = "done"
+    submission.passed = result.passed
+    submission.result_id = result.id
+    submission.finished_at = datetime.utcnow()
+    if result.passed and submission.award:
+        user_problem = db.session.execute(
+            db.select(UserProblem).where(
+                UserProblem.user_id == submission.user_id, UserProblem.problem_id == submission.problem_id
+            )
+        ).scalar_one()
+        award_solve(user_problem, db.session.get(Problem, submission.problem_id))
+
+
+def _check(code, tests, timeout):
+    status, outputs = pool().run(code, [test.input for test in tests], timeout)
+    details = []
+    for test, output in zip(tests, outputs):
+        passed = output["error"] is None and _normalize(output["stdout"]) == _normalize(test.expected)
+        entry = {"position": test.position, "passed": passed, "hidden": test.is_hidden}
+        if not test.is_hidden:
+            entry.update(input=test.input, expected=test.expected, stdout=output["stdout"], error=output["error"])
+        details.append(entry)
+    passed = status == "ok" and bool(tests) and len(details) == len(tests) and all(d["passed"] for d in details)
+    return ("passed" if passed else "failed" if status == "ok" else status), passed, details
+
+
+def abandon_submissions(payloads):
+    db.session.execute(
+        db.update(Submission)
+        .where(Submission.id.in_([p["submission_id"] for p in payloads]), Submission.status == "queued")
+        .values(status="error", finished_at=datetime.utcnow())
+    )
+
+
+@handler("run_code", on_failure=abandon_submissions)
+def run_submissions(payloads):
+    submissions = db.session.execute(
+        db.select(Submission)
+        .options(db.undefer(Submission.code))
+        .where(Submission.id.in_([p["submission_id"] for p in payloads]), Submission.status == "queued")
+    ).scalars().all()
+    if not submissions:
+        return
+    tests = {}
+    for test in db.session.execute(
+        db.select(ProblemTest)
+        .where(ProblemTest.problem_id.in_({s.problem_id for s in submissions}))
+        .order_by(ProblemTest.problem_id, ProblemTest.position, ProblemTest.id)
+    ).scalars():
+        tests.setdefault(test.problem_id, []).append(test)
+
+    # Identical code for the same tests runs once per batch
+    unique = {}
+    for submission in submissions:
+        unique.setdefault((submission.problem_id, submission.tests_version, submission.code_hash), submission.code)
+    app = current_app._get_current_object()
+    timeout = app.config.get("SANDBOX_TIME_LIMIT", 5)
+    try:
+        pool()  # start interpreters before fanning out
+    except SandboxUnavailable:
+        # Retrying won't help until the deployment is fixed
+        log.exception("Sandbox unavailable; %d submission(s) not run", len(submissions))
+        abandon_submissions(payloads)
+        return
+    with ThreadPoolExecutor(max_workers=max(app.config.get("SANDBOX_POOL_SIZE", 2), 1)) as executor:
+        outcomes = dict(zip(unique, executor.map(
+            lambda item: _check(item[1], tests.get(item[0][0], []), timeout), unique.items()
+        )))
+
+    upsert(
+        RunResult,
+        [
+            {
+                "problem_id": problem_id,
+                "tests_version": tests_version,
+                "code_hash": digest,
+                "status": status,
+                "passed": passed,
+                "details": json.dumps(details),
+            }
+            for (problem_id, tests_version, digest), (status, passed, details) in outcomes.items()
+        ],
+        index_elements=["problem_id", "tests_version", "code_hash"],
+        replace=["status", "passed", "details"],
+    )
+    results = {
+        (r.problem_id, r.tests_version, r.code_hash): r
+        for r in db.session.execute(
+            db.select(RunResult).where(RunResult.code_hash.in_({key[2] for key in outcomes}))
+        ).scalars()
+    }
+    for submission in submissions:
+        _finish(submission, results[(submission.problem_id, submission.tests_version, submission.code_hash)])
+
+
+def submission_json(submission):
+    data = {"id": submission.id, "status": submission.status, "passed": submission.passed}
+    if submission.result_id:
+        result = db.session.get(RunResult, submission.result_id)
+        data.update(result=result.status, tests=json.loads(result.details))
+    return data
@@ -0,0 +1,237 @@
+import grp
+import json
+import logging
+import os
+import pwd
+import queue
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+from threading import Lock, Thread
+from flask import current_app
+
+
+# Each run gets a fresh `python -I -S` child that was started ahead of time
+# and is blocked reading its job from stdin, so a submission doesn't wait for
+# interpreter startup. The child is started by `unshare --net` in a network
+# namespace of its own (loopback only, and down), then switches to
+# SANDBOX_USER/SANDBOX_GROUP with no supplementary groups, so it can't reach
+# the network or the worker's /proc/<pid>/environ (which holds SECRET_KEY and
+# DATABASE_URL). Keep the app tree and any secret files unreadable to that
+# user as well; the interpreter and its stdlib must stay readable to it.
+# Before reading the job the child also caps its own CPU time, address
+# space, file size, open files and process count (hard limits, so the
+# submitted code can't raise them); the parent enforces wall time and kills
+# the whole process group. Children are single use: after one job they exit
+# and the pool starts a replacement in the background.
+#
+# Switching users and creating the namespace need root (or CAP_SETUID,
+# CAP_SETGID and CAP_SYS_ADMIN) in the worker. The pool checks a child's
+# isolation before it runs anything and refuses to start without it, unless
+# SANDBOX_ALLOW_UNISOLATED is set for local development.
+
+log = logging.getLogger(__name__)
+ISOLATION_FAILED = 3  # child exit status when it couldn't isolate itself
+
+
+class SandboxUnavailable(RuntimeError):
+    pass
+
+
+_BOOT = r"""
+import io, json, os, resource, sys
+limits = json.loads(sys.argv[1])
+if limits["uid"] is not None:
+    try:
+        os.setgroups([])
+        os.setgid(limits["gid"])
+        os.setuid(limits["uid"])
+    except OSError:
+        os._exit(3)
+    try:
+        os.setuid(0)  # must not be able to get back
+    except OSError:
+        pass
+    else:
+        os._exit(3)
+    with open("/proc/self/net/dev") as dev:
+        if [line.split(":")[0].strip() for line in dev.readlines()[2:]] != ["lo"]:
+            os._exit(3)
+for name, value in (
+    ("RLIMIT_CPU", limits["cpu"]),
+    ("RLIMIT_AS", limits["memory"]),
+    ("RLIMIT_FSIZE", 0),
+    ("RLIMIT_NOFILE", 32),
+    ("RLIMIT_NPROC", 0),
+    ("RLIMIT_CORE", 0),
+):
+    resource.setrlimit(getattr(resource, name), (value, value))
+job = json.loads(sys.stdin.read() or "null")
+if job is None:
+    os._exit(0)
+out = os.fdopen(os.dup(1), "w")
+null = os.open(os.devnull, os.O_WRONLY)
+os.dup2(null, 1)
+os.dup2(null, 2)
+results = []
+try:
+    code = compile(job["code"], "<solution>", "exec")
+except (SyntaxError, ValueError) as exc:
+    code, compile_error = None, type(exc).__name__ + ": " + str(exc)
+for data in job["inputs"]:
+    if code is None:
+        results.append({"stdout": "", "error": compile_error})
+        continue
+    buffer = io.StringIO()
+    sys.stdin, sys.stdout, error = io.StringIO(data), buffer, None
+    try:
+        exec(code, {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit:
+        pass
+    except BaseException as exc:
+        error = (type(exc).__name__ + ": " + str(exc))[:1000]
+    sys.stdout = sys.__stdout__
+    results.append({"stdout": buffer.getvalue()[:job["max_output"]], "error": error})
+out.write(json.dumps(results))
+out.flush()
+os._exit(0)
+"""
+
+
+def _resolve(user, group):
+    # (uid, gid) for names or numeric ids; the group defaults to the user's
+    try:
+        entry = pwd.getpwuid(int(user)) if str(user).isdigit() else pwd.getpwnam(user)
+        gid = entry.pw_gid
+        if group:
+            gid = int(group) if str(group).isdigit() else grp.getgrnam(group).gr_gid
+    except KeyError as exc:
+        raise SandboxUnavailable(f"Unknown sandbox user or group: {exc}") from None
+    if entry.pw_uid == 0 or gid == 0:
+        raise SandboxUnavailable("The sandbox user and group must not be root.")
+    return entry.pw_uid, gid
+
+
+class SandboxPool:
+    def __init__(self, size, cpu_seconds, memory_mb, max_output, user=None, group=None):
+        # user=None runs children as the worker's own user, with no namespace
+        self.size = size
+        self.max_output = max_output
+        uid = gid = None
+        self._prefix = []
+        if user is not None:
+            uid, gid = _resolve(user, group)
+            unshare = shutil.which("unshare")
+            if not unshare:
+                raise SandboxUnavailable("util-linux `unshare` is needed for the sandbox network namespace.")
+            self._prefix = [unshare, "--net", "--"]
+        self._limits = json.dumps({"cpu": cpu_seconds, "memory": memory_mb * 1024 * 1024, "uid": uid, "gid": gid})
+        self._dir = tempfile.mkdtemp(prefix="sandbox-")
+        self._idle = queue.Queue()
+        self._fill_lock = Lock()
+        self._check()
+        self._fill()
+
+    def _check(self):
+        # A child exits straight away on an empty job, after isolating itself
+        try:
+            proc = self._spawn()
+            proc.communicate(b"null", timeout=10)
+        except (OSError, subprocess.SubprocessError) as exc:
+            raise SandboxUnavailable(f"Could not start a sandbox child: {exc}") from exc
+        if proc.returncode != 0:
+            raise SandboxUnavailable(
+                "Sandbox children could not drop privileges or enter their own network "
+                f"namespace (exit status {proc.returncode}); the worker needs root or "
+                "CAP_SETUID, CAP_SETGID and CAP_SYS_ADMIN."
+            )
+
+    def _spawn(self):
+        return subprocess.Popen(
+            self._prefix + [sys.executable, "-I", "-S", "-c", _BOOT, self._limits],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=self._dir,
+            env={},
+            start_new_session=True,
+        )
+
+    def _fill(self):
+        with self._fill_lock:
+            while self._idle.qsize() < self.size:
+                self._idle.put(self._spawn())
+
+    def _take(self):
+        while True:
+            try:
+                proc = self._idle.get_nowait()
+            except queue.Empty:
+                proc = self._spawn()
+            if proc.poll() is None:
+                break
+        Thread(target=self._fill, daemon=True).start()
+        return proc
+
+    def run(self, code, inputs, timeout):
+        # Returns (status, [{"stdout", "error"}, ...]); status is ok, timeout or crashed
+        proc = self._take()
+        job = json.dumps({"code": code, "inputs": inputs, "max_output": self.max_output}).encode("utf-8")
+        try:
+            out, _ = proc.communicate(job, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill(proc)
+            proc.communicate()
+            return "timeout", []
+        if proc.returncode == -signal.SIGXCPU or proc.returncode == -signal.SIGKILL:
+            return "timeout", []
+        if proc.returncode == ISOLATION_FAILED and not out:
+            log.error("A sandbox child failed to isolate itself; the job was not run.")
+            return "crashed", []
+        try:
+            return "ok", json.loads(out)
+        except ValueError:
+            return "crashed", []
+
+    def close(self):
+        while True:
+            try:
+                _kill(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+def _kill(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+_lock = Lock()
+_pool = None  # (pid, SandboxPool)
+
+
+def pool():
+    global _pool
+    with _lock:
+        # Children of a forked parent's pool aren't ours to reuse
+        if _pool is None or _pool[0] != os.getpid():
+            config = current_app.config
+            user = config.get("SANDBOX_USER")
+            if config.get("SANDBOX_ALLOW_UNISOLATED"):
+                log.warning("Running submitted code without user or network isolation.")
+                user = None
+            elif not user:
+                raise SandboxUnavailable("SANDBOX_USER is not set; refusing to run submitted code.")
+            _pool = (os.getpid(), SandboxPool(
+                config.get("SANDBOX_POOL_SIZE", 2),
+                config.get("SANDBOX_CPU_SECONDS", 4),
+                config.get("SANDBOX_MEMORY_MB", 256),
+                config.get("SANDBOX_MAX_OUTPUT", 65536),
+                user=user,
+                group=config.get("SANDBOX_GROUP") or None,
+            ))
+        return _pool[1]
@@ -0,0 +1,154 @@
+import re
+from threading import Lock
+from sqlalchemy import inspect, text
+from .extensions import db
+
+
+# Full-text index over problem titles, tag names and prompts. Postgres keeps a
+# weighted tsvector per problem behind a GIN index; SQLite uses an FTS5 table
+# whose rowid is the problem id. The index is created and backfilled by
+# `flask search-index`; until then search returns nothing and writes skip it.
+
+PAGE_SIZE = 20
+# Scores are paged as integers: ts_rank is float4 and wouldn't survive the
+# round trip through a cursor string, so equality on it misses rows
+SCORE_SCALE = 1000000
+_lock = Lock()
+_ready = set()
+
+_PG_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS problem_search ("
+    " problem_id INTEGER PRIMARY KEY REFERENCES problems(id) ON DELETE CASCADE,"
+    " document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_problem_search_document ON problem_search USING GIN (document)",
+)
+_SQLITE_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS problem_search USING fts5("
+    "title, tags, prompt, tokenize='porter unicode61')",
+)
+
+_PG_INDEX = """
+INSERT INTO problem_search (problem_id, document)
+SELECT p.id,
+       setweight(to_tsvector('english', p.title), 'A')
+       || setweight(to_tsvector('english', coalesce(string_agg(t.name, ' '), '')), 'B')
+       || setweight(to_tsvector('english', coalesce(p.prompt, '')), 'C')
+FROM problems p
+LEFT JOIN problem_tags pt ON pt.problem_id = p.id
+LEFT JOIN tags t ON t.id = pt.tag_id
+{where}
+GROUP BY p.id
+ON CONFLICT (problem_id) DO UPDATE SET document = EXCLUDED.document
+"""
+_SQLITE_INDEX = """
+INSERT INTO problem_search (rowid, title, tags, prompt)
+SELECT p.id, p.title, coalesce(group_concat(t.name, ' '), ''), coalesce(p.prompt, '')
+FROM problems p
+LEFT JOIN problem_tags pt ON pt.problem_id = p.id
+LEFT JOIN tags t ON t.id = pt.tag_id
+{where}
+GROUP BY p.id
+"""
+
+
+def _is_postgres():
+    return db.session.get_bind().dialect.name == "postgresql"
+
+
+def _index(problem_ids=None):
+    where, params = "", {}
+    if problem_ids is not None:
+        params = {f"p{i}": pid for i, pid in enumerate(problem_ids)}
+        where = "WHERE p.id IN ({})".format(", ".join(f":{key}" for key in params))
+    if _is_postgres():
+        db.session.execute(text(_PG_INDEX.format(where=where)), params)
+        return
+    db.session.execute(text("DELETE FROM problem_search " + where.replace("p.id", "rowid")), params)
+    db.session.execute(text(_SQLITE_INDEX.format(where=where)), params)
+
+
+def index_ready() -> bool:
+    bind = db.session.get_bind()
+    if bind.url in _ready:
+        return True
+    with _lock:
+        if inspect(db.session.connection()).has_table("problem_search"):
+            _ready.add(bind.url)
+            return True
+    return False
+
+
+def ensure_index() -> bool:
+    # Creates and backfills the index, in the current transaction; only for
+    # `flask search-index`. Returns True when it created it.
+    if index_ready():
+        return False
+    bind = db.session.get_bind()
+    conn = db.session.connection()
+    for statement in _PG_SCHEMA if bind.dialect.name == "postgresql" else _SQLITE_SCHEMA:
+        conn.execute(text(statement))
+    _index()
+    return True
+
+
+def index_problems(problem_ids):
+    # Call inside the transaction that created or changed these problems
+    if not problem_ids or not index_ready():
+        return
+    problem_ids = list(problem_ids)
+    for start in range(0, len(problem_ids), 500):
+        _index(problem_ids[start:start + 500])
+
+
+def rebuild_index():
+    if not ensure_index():
+        _index()
+    db.session.commit()
+
+
+def _terms(query: str):
+    return re.findall(r"\w+", query.lower())[:12]
+
+
+def search(query, user_id, difficulty=None, chapter_id=None, status=None, after=None, limit=PAGE_SIZE):
+    # Returns rows (id, score, status) ordered by relevance, keyset-paged on
+    # (score, id); score is the relevance scaled by SCORE_SCALE as an integer
+    terms = _terms(query)
+    if not terms or not index_ready():
+        return []
+    params = {"user_id": user_id, "limit": limit}
+    if _is_postgres():
+        params["q"] = " & ".join(f"{term}:*" for term in terms)
+        score = "ts_rank(s.document, to_tsquery('english', :q))"
+        source = "problem_search s JOIN problems p ON p.id = s.problem_id"
+        match = "s.document @@ to_tsquery('english', :q)"
+    else:
+        params["q"] = " AND ".join(f'"{term}"*' for term in terms)
+        score = "-bm25(problem_search, 10.0, 5.0, 1.0)"
+        source = "problem_search JOIN problems p ON p.id = problem_search.rowid"
+        match = "problem_search MATCH :q"
+    score = f"CAST(round(({score}) * {SCORE_SCALE}) AS BIGINT)"
+
+    filters = [match]
+    if difficulty:
+        filters.append("p.difficulty = :difficulty")
+        params["difficulty"] = difficulty
+    if chapter_id:
+        filters.append("p.chapter_id = :chapter_id")
+        params["chapter_id"] = chapter_id
+    if status == "unsolved":
+        filters.append("(up.status IS NULL OR up.status = 'unsolved')")
+    elif status in ("attempted", "solved"):
+        filters.append("up.status = :status")
+        params["status"] = status
+    if after:
+        filters.append(f"({score} < :after_score OR ({score} = :after_score AND p.id > :after_id))")
+        params["after_score"], params["after_id"] = after
+
+    sql = (
+        f"SELECT p.id AS id, {score} AS score, up.status AS status FROM {source} "
+        "LEFT JOIN user_problems up ON up.problem_id = p.id AND up.user_id = :user_id "
+        f"WHERE {' AND '.join(filters)} "
+        "ORDER BY score DESC, p.id ASC LIMIT :limit"
+    )
+    return db.session.execute(text(sql), params).all()
@@ -0,0 +1,63 @@
+from datetime import date, datetime
+import json
+from .extensions import db
+from .jobs import enqueue, handler
+from .models import ActivityLog
+from .utils import add_board_scores, log_time_samples
+
+
+# Side effects that don't change what the user sees in the response. The
+# defer_* helpers queue them; the handlers below apply a batch at a time.
+
+def defer_activity(user_id, action, ref_type=None, ref_id=None, meta=None):
+    enqueue("activity", {
+        "user_id": user_id,
+        "action": action,
+        "ref_type": ref_type,
+        "ref_id": ref_id,
+        "meta_json": json.dumps(meta or {}),
+        "created_at": datetime.utcnow().isoformat(),
+    })
+
+
+def defer_board_scores(user_id, amount, chapter_id=None, today=None):
+    enqueue("board_scores", {
+        "user_id": user_id,
+        "amount": amount,
+        "chapter_id": chapter_id,
+        "day": (today or date.today()).isoformat(),
+    })
+
+
+def defer_time(user_id, samples, today=None):
+    enqueue("time", {
+        "user_id": user_id,
+        "samples": [list(sample) for sample in samples],
+        "day": (today or date.today()).isoformat(),
+    })
+
+
+@handler("activity")
+def apply_activity(payloads):
+    db.session.execute(db.insert(ActivityLog), [
+        dict(payload, created_at=datetime.fromisoformat(payload["created_at"])) for payload in payloads
+    ])
+
+
+@handler("board_scores")
+def apply_board_scores(payloads):
+    for payload in payloads:
+        add_board_scores(
+            payload["user_id"], payload["amount"], payload["chapter_id"], date.fromisoformat(payload["day"])
+        )
+
+
+@handler("time")
+def apply_time(payloads):
+    # Heartbeats from the same user and day collapse into one set of upserts
+    merged = {}
+    for payload in payloads:
+        key = (payload["user_id"], payload["day"])
+        merged.setdefault(key, []).extend(tuple(sample) for sample in payload["samples"])
+    for (user_id, day), samples in merged.items():
+        log_time_samples(user_id, samples, date.fromisoformat(day))
@@ -0,0 +1,86 @@
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+from threading import Lock
+from .extensions import db
+from .models import DailyTime, UserProblem
+
+
+CACHE_SIZE = 1024
+_cache = OrderedDict()
+_lock = Lock()
+
+
+def _heat_level(seconds: int) -> int:
+    if seconds <= 0:
+        return 0
+    if seconds < 15 * 60:
+        return 1
+    if seconds < 45 * 60:
+        return 2
+    if seconds < 90 * 60:
+        return 3
+    return 4
+
+
+def _build(user_id: int, year: int) -> dict:
+    start, end = date(year, 1, 1), date(year + 1, 1, 1)
+    seconds = dict(db.session.execute(
+        db.select(DailyTime.day, DailyTime.seconds)
+        .where(DailyTime.user_id == user_id, DailyTime.day >= start, DailyTime.day < end)
+    ).all())
+    solved_days = defaultdict(int)
+    for (solved_at,) in db.session.execute(
+        db.select(UserProblem.solved_at).where(
+            UserProblem.user_id == user_id,
+            UserProblem.solved_at >= datetime.combine(start, datetime.min.time()),
+            UserProblem.solved_at < datetime.combine(end, datetime.min.time()),
+        )
+    ):
+        solved_days[solved_at.date()] += 1
+
+    weekly, monthly = defaultdict(lambda: [0, 0]), defaultdict(lambda: [0, 0])
+    for day in set(seconds) | set(solved_days):
+        iso_year, iso_week, _ = day.isocalendar()
+        for key, bucket in ((f"{iso_year}-W{iso_week:02d}", weekly), (f"{day:%Y-%m}", monthly)):
+            bucket[key][0] += seconds.get(day, 0)
+            bucket[key][1] += solved_days.get(day, 0)
+
+    # Heatmap columns are weeks starting on Monday, padded with None outside the year
+    heatmap = []
+    day = start - timedelta(days=start.weekday())
+    while day < end:
+        week = []
+        for _ in range(7):
+            if start <= day < end:
+                secs = seconds.get(day, 0)
+                week.append({"day": day.isoformat(), "seconds": secs, "solved": solved_days.get(day, 0), "level": _heat_level(secs)})
+            else:
+                week.append(None)
+            day += timedelta(days=1)
+        heatmap.append(week)
+
+    return {
+        "year": year,
+        "total_seconds": sum(seconds.values()),
+        "total_solved": sum(solved_days.values()),
+        "active_days": sum(1 for s in seconds.values() if s > 0),
+        "heatmap": heatmap,
+        "weekly": [{"week": k, "seconds": v[0], "solved": v[1]} for k, v in sorted(weekly.items())],
+        "monthly": [{"month": k, "seconds": v[0], "solved": v[1]} for k, v in sorted(monthly.items())],
+    }
+
+
+def activity_series(stats, year: int) -> dict:
+    # The stats counters move whenever time is logged or a problem is solved,
+    # so they double as a cache version that every worker can see for free.
+    key = (stats.user_id, year, stats.total_time_sec, stats.xp, date.today())
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    series = _build(stats.user_id, year)
+    with _lock:
+        _cache[key] = series
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return series
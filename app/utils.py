@@ -1,7 +1,13 @@
-from datetime import date
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+import json
 import re
+from sqlalchemy import case
+from sqlalchemy.dialects import postgresql, sqlite
 from .extensions import db
-from .models import UserStats, DailyTime
+from .models import (
+    UserStats, DailyTime, Chapter, ChapterProgress, UserProblem, ActivityLog, LeaderboardScore, CatalogVersion,
+)
 
 
 def slugify(text: str) -> str:
@@ -18,31 +24,141 @@ def level_from_xp(xp: int) -> int:
     return level
 
 
-def add_xp(stats: UserStats, amount: int):
-    stats.xp += amount
-    stats.level = level_from_xp(stats.xp)
+def week_board(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"week:{year}-{week:02d}"
 
 
-def update_streak(stats: UserStats, today: date):
-    if not stats.last_activity_date:
-        stats.current_streak = 1
-    else:
-        delta = (today - stats.last_activity_date).days
-        if delta == 0:
-            return
-        if delta == 1:
-            stats.current_streak += 1
-        else:
-            stats.current_streak = 1
-    if stats.current_streak > stats.longest_streak:
-        stats.longest_streak = stats.current_streak
-    stats.last_activity_date = today
+def add_board_scores(user_id: int, amount: int, chapter_id: int = None, today: date = None):
+    boards = ["global", week_board(today or date.today())]
+    if chapter_id:
+        boards.append(f"chapter:{chapter_id}")
+    upsert(
+        LeaderboardScore,
+        [{"board": board, "user_id": user_id, "score": amount} for board in boards],
+        index_elements=["board", "user_id"],
+        increment=["score"],
+    )
+
+
+def bump_stats(user_id: int, xp: int = 0, seconds: int = 0, today: date = None, progress: bool = False):
+    # Applies every UserStats change of a request as one UPDATE computed from
+    # the stored row, so concurrent tabs and workers can't lose increments.
+    # Level and streaks are derived in the same statement.
+    values = {}
+    if xp:
+        new_xp = db.func.coalesce(UserStats.xp, 0) + xp
+        values["xp"] = new_xp
+        # Inverse of level_from_xp: the first level whose threshold is above xp
+        values["level"] = db.cast(db.func.floor(db.func.sqrt(new_xp / 100.0)), db.Integer) + 1
+    if seconds:
+        values["total_time_sec"] = db.func.coalesce(UserStats.total_time_sec, 0) + seconds
+    if today:
+        current = db.func.coalesce(UserStats.current_streak, 0)
+        longest = db.func.coalesce(UserStats.longest_streak, 0)
+        streak = case(
+            (UserStats.last_activity_date == today, current),
+            (UserStats.last_activity_date == today - timedelta(days=1), current + 1),
+            else_=1,
+        )
+        values["current_streak"] = streak
+        values["longest_streak"] = case((streak > longest, streak), else_=longest)
+        values["last_activity_date"] = today
+    if progress:
+        values["progress_version"] = UserStats.progress_version + 1
+        values["progress_updated_at"] = datetime.utcnow()
+    if values:
+        db.session.execute(
+            db.update(UserStats)
+            .where(UserStats.user_id == user_id)
+            .values(**values)
+            .execution_options(identity_user_id=user_id)
+        )
 
 
 def add_daily_time(user_id: int, seconds: int, today: date):
-    row = DailyTime.query.filter_by(user_id=user_id, day=today).first()
-    if not row:
-        row = DailyTime(user_id=user_id, day=today, seconds=0)
-        db.session.add(row)
-    row.seconds += seconds
-    return row
+    upsert(
+        DailyTime,
+        {"user_id": user_id, "day": today, "seconds": seconds},
+        index_elements=["user_id", "day"],
+        increment=["seconds"],
+    )
+
+
+def upsert(model, values, index_elements, increment=(), replace=()):
+    # INSERT ... ON CONFLICT DO UPDATE, supported by both Postgres and SQLite
+    dialect = postgresql if db.session.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(model.__table__).values(values)
+    set_ = {col: model.__table__.c[col] + stmt.excluded[col] for col in increment}
+    set_.update({col: stmt.excluded[col] for col in replace})
+    if set_:
+        stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+    db.session.execute(stmt)
+
+
+def record_solve(user_id: int, chapter_id: int):
+    upsert(
+        ChapterProgress,
+        {"user_id": user_id, "chapter_id": chapter_id, "solved": 1},
+        index_elements=["user_id", "chapter_id"],
+        increment=["solved"],
+    )
+
+
+def bump_catalog_version():
+    upsert(
+        CatalogVersion,
+        {"id": 1, "version": 1, "updated_at": datetime.utcnow()},
+        index_elements=["id"],
+        increment=["version"],
+        replace=["updated_at"],
+    )
+    db.session.info["catalog_dirty"] = True
+
+
+def add_chapter_problems(chapter_id: int, count: int = 1):
+    db.session.execute(
+        db.update(Chapter)
+        .where(Chapter.id == chapter_id)
+        .values(problem_count=Chapter.problem_count + count)
+    )
+    bump_catalog_version()
+
+
+def log_time_samples(user_id: int, samples, today: date) -> int:
+    # Merge (problem_id, seconds) samples and apply them as one upsert per table
+    # Callers are expected to drop samples for unknown problems first
+    per_problem = defaultdict(int)
+    for problem_id, seconds in samples:
+        if seconds > 0:
+            per_problem[problem_id] += seconds
+    if not per_problem:
+        return 0
+
+    total = sum(per_problem.values())
+    now = datetime.utcnow()
+    upsert(
+        UserProblem,
+        [
+            {"user_id": user_id, "problem_id": pid, "time_spent_sec": seconds, "updated_at": now}
+            for pid, seconds in per_problem.items()
+        ],
+        index_elements=["user_id", "problem_id"],
+        increment=["time_spent_sec"],
+        replace=["updated_at"],
+    )
+    add_daily_time(user_id, total, today)
+    bump_stats(user_id, seconds=total, today=today)
+    db.session.add_all([
+        ActivityLog(
+            user_id=user_id,
+            action="time_log",
+            ref_type="problem",
+            ref_id=pid,
+            meta_json=json.dumps({"seconds": seconds}),
+        )
+        for pid, seconds in per_problem.items()
+    ])
+    return total
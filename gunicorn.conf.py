@@ -0,0 +1,52 @@
+import multiprocessing
+import os
+
+
+# Production profile: `gunicorn -c gunicorn.conf.py wsgi:app`.
+# The app is imported once in the master (preload) and forked; each worker
+# then drops the inherited connection pools and opens its own.
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+preload_app = True
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "4"))
+
+
+def _workers():
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.getenv("WEB_CONCURRENCY"))
+    workers = multiprocessing.cpu_count() * 2 + 1
+    # Leave room under max_connections: each worker owns a full pool
+    max_connections = int(os.getenv("DB_MAX_CONNECTIONS", "0"))
+    if max_connections:
+        per_worker = int(os.getenv("DB_POOL_SIZE", str(threads))) + int(os.getenv("DB_MAX_OVERFLOW", "2"))
+        workers = min(workers, max_connections // per_worker)
+    return max(workers, 1)
+
+
+workers = _workers()
+timeout = int(os.getenv("WEB_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "20"))
+keepalive = 5
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "2000"))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+
+def _dispose_engines(close):
+    from wsgi import app
+    from app.extensions import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def pre_fork(server, worker):
+    # Anything the master opened while preloading must not be shared
+    _dispose_engines(close=True)
+
+
+def post_fork(server, worker):
+    # Leave the parent's sockets alone; the worker gets fresh pools
+    _dispose_engines(close=False)
@@ -1,4 +1,10 @@
 (function () {
+  var csrfToken = null;
+  var meta = document.querySelector('meta[name="csrf-token"]');
+  if (meta) {
+    csrfToken = meta.getAttribute("content");
+  }
+
   if (window.PC_PROBLEM_ID) {
     var key = "pc_code_" + window.PC_PROBLEM_ID;
     var textarea = document.getElementById("code");
@@ -12,25 +18,231 @@
       });
     }
 
-    var lastPing = Date.now();
-    var csrfToken = null;
-    var meta = document.querySelector('meta[name="csrf-token"]');
-    if (meta) {
-      csrfToken = meta.getAttribute("content");
+    // Server autosave: send debounced code-point splices against the last
+    // version the server acknowledged, with a hash of that text so the server
+    // can refuse splices computed against anything else. Needs SubtleCrypto,
+    // which browsers only offer on HTTPS and localhost.
+    var notesArea = document.getElementById("notes");
+    var status = document.getElementById("autosave-status");
+    var subtle = window.crypto && window.crypto.subtle;
+    if (textarea && notesArea && subtle && window.TextEncoder && typeof window.PC_VERSION === "number") {
+      var AUTOSAVE_DELAY = 1500;
+      var version = window.PC_VERSION;
+      var server = { code: textarea.defaultValue, notes: notesArea.defaultValue };
+      var timer = null;
+      var inFlight = false;
+      var stopped = false;
+
+      var splice = function (before, after) {
+        var a = Array.from(before);
+        var b = Array.from(after);
+        var start = 0;
+        while (start < a.length && start < b.length && a[start] === b[start]) start++;
+        var endA = a.length;
+        var endB = b.length;
+        while (endA > start && endB > start && a[endA - 1] === b[endB - 1]) {
+          endA--;
+          endB--;
+        }
+        if (start === endA && start === endB) return [];
+        return [{ start: start, end: endA, text: b.slice(start, endB).join("") }];
+      };
+
+      // Same as the server's content_hash: sha256 of code + "\0" + notes
+      var baseHash = function (text) {
+        var data = new TextEncoder().encode(text.code + "\u0000" + text.notes);
+        return subtle.digest("SHA-256", data).then(function (digest) {
+          return Array.from(new Uint8Array(digest)).map(function (b) {
+            return ("0" + b.toString(16)).slice(-2);
+          }).join("");
+        });
+      };
+
+      var autosave = function () {
+        timer = null;
+        if (stopped) return;
+        if (inFlight) {
+          schedule();
+          return;
+        }
+        var sent = { code: textarea.value, notes: notesArea.value };
+        var codePatch = splice(server.code, sent.code);
+        var notesPatch = splice(server.notes, sent.notes);
+        if (!codePatch.length && !notesPatch.length) return;
+        inFlight = true;
+        baseHash(server).then(function (base) {
+          return fetch("/problems/" + window.PC_PROBLEM_ID + "/autosave", {
+            method: "POST",
+            headers: {
+              "Content-Type": "application/json",
+              "X-CSRFToken": csrfToken || ""
+            },
+            body: JSON.stringify({ version: version, base: base, code: codePatch, notes: notesPatch })
+          });
+        }).then(function (response) {
+          if (response.status === 409) {
+            stopped = true;
+            if (status) status.textContent = "Edited in another tab. Reload to keep autosaving.";
+            return;
+          }
+          if (!response.ok) throw new Error("autosave failed");
+          return response.json().then(function (data) {
+            version = data.version;
+            server = sent;
+            if (status) status.textContent = "Saved to server (v" + version + ").";
+          });
+        }).catch(function () {
+          if (status) status.textContent = "Autosave failed; retrying.";
+          schedule();
+        }).then(function () {
+          inFlight = false;
+        });
+      };
+
+      var schedule = function () {
+        if (timer) clearTimeout(timer);
+        timer = setTimeout(autosave, AUTOSAVE_DELAY);
+      };
+
+      textarea.addEventListener("input", schedule);
+      notesArea.addEventListener("input", schedule);
+      if (textarea.value !== server.code) schedule();
+    }
+
+    // Test runs are queued server side; poll until the submission is checked.
+    var runButton = document.getElementById("run-tests");
+    var runResults = document.getElementById("run-results");
+    if (runButton && runResults && textarea) {
+      var showRun = function (data) {
+        runResults.innerHTML = "";
+        (data.tests || []).forEach(function (test) {
+          var item = document.createElement("li");
+          item.className = test.passed ? "status-solved" : "status-attempted";
+          var text = "Test " + (test.position + 1) + ": " + (test.passed ? "passed" : "failed");
+          if (!test.hidden && !test.passed) {
+            text += test.error ? " (" + test.error + ")" : " (got " + JSON.stringify(test.stdout) + ")";
+          }
+          item.textContent = text;
+          runResults.appendChild(item);
+        });
+        if (data.result && data.result !== "passed" && data.result !== "failed") {
+          var note = document.createElement("li");
+          note.textContent = data.result === "timeout" ? "Time limit exceeded." : "The run crashed.";
+          runResults.appendChild(note);
+        }
+      };
+      var poll = function (id, delay) {
+        setTimeout(function () {
+          fetch("/problems/" + window.PC_PROBLEM_ID + "/submissions/" + id).then(function (response) {
+            return response.json();
+          }).then(function (data) {
+            if (data.status === "done") {
+              showRun(data);
+              runButton.disabled = false;
+            } else if (data.status === "error") {
+              runResults.innerHTML = "<li>Tests can't be run right now; try again later.</li>";
+              runButton.disabled = false;
+            } else {
+              poll(id, Math.min(delay * 2, 4000));
+            }
+          }).catch(function () {
+            runButton.disabled = false;
+          });
+        }, delay);
+      };
+      runButton.addEventListener("click", function () {
+        runButton.disabled = true;
+        runResults.innerHTML = "<li class=\"muted\">Running...</li>";
+        fetch("/problems/" + window.PC_PROBLEM_ID + "/run", {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            "X-CSRFToken": csrfToken || ""
+          },
+          body: JSON.stringify({ code: textarea.value })
+        }).then(function (response) {
+          return response.json();
+        }).then(function (data) {
+          if (data.error) {
+            runResults.innerHTML = "";
+            var item = document.createElement("li");
+            item.textContent = data.error;
+            runResults.appendChild(item);
+            runButton.disabled = false;
+          } else if (data.status === "done") {
+            showRun(data);
+            runButton.disabled = false;
+          } else {
+            poll(data.id, 250);
+          }
+        }).catch(function () {
+          runButton.disabled = false;
+        });
+      });
+    }
+
+    // Time tracking: accumulate seconds locally and flush them in batches.
+    var FLUSH_INTERVAL = 5 * 60 * 1000;
+    var pendingKey = "pc_time_pending";
+    var lastTick = Date.now();
+
+    function readPending() {
+      try {
+        return JSON.parse(localStorage.getItem(pendingKey)) || {};
+      } catch (e) {
+        return {};
+      }
     }
-    setInterval(function () {
+
+    function tick() {
       var now = Date.now();
-      var seconds = Math.floor((now - lastPing) / 1000);
-      lastPing = now;
+      var seconds = Math.floor((now - lastTick) / 1000);
       if (seconds <= 0) return;
-      fetch("/problems/" + window.PC_PROBLEM_ID + "/time", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "X-CSRFToken": csrfToken || ""
-        },
-        body: JSON.stringify({ seconds: seconds })
+      lastTick += seconds * 1000;
+      var pending = readPending();
+      pending[window.PC_PROBLEM_ID] = (pending[window.PC_PROBLEM_ID] || 0) + seconds;
+      localStorage.setItem(pendingKey, JSON.stringify(pending));
+    }
+
+    function takeSamples() {
+      tick();
+      var pending = readPending();
+      localStorage.removeItem(pendingKey);
+      var samples = [];
+      Object.keys(pending).forEach(function (problemId) {
+        if (pending[problemId] > 0) {
+          samples.push({ problem_id: Number(problemId), seconds: pending[problemId] });
+        }
+      });
+      return samples;
+    }
+
+    function flush(useBeacon) {
+      var samples = takeSamples();
+      if (!samples.length) return;
+      var body = new FormData();
+      body.append("csrf_token", csrfToken || "");
+      body.append("samples", JSON.stringify(samples));
+      if (useBeacon && navigator.sendBeacon && navigator.sendBeacon("/time", body)) {
+        return;
+      }
+      fetch("/time", { method: "POST", body: body, keepalive: true }).catch(function () {
+        // Put the samples back so the next flush retries them.
+        var pending = readPending();
+        samples.forEach(function (s) {
+          pending[s.problem_id] = (pending[s.problem_id] || 0) + s.seconds;
+        });
+        localStorage.setItem(pendingKey, JSON.stringify(pending));
       });
-    }, 60000);
+    }
+
+    setInterval(tick, 15000);
+    setInterval(function () { flush(false); }, FLUSH_INTERVAL);
+    document.addEventListener("visibilitychange", function () {
+      if (document.visibilityState === "hidden") {
+        flush(true);
+      }
+    });
+    window.addEventListener("pagehide", function () { flush(true); });
   }
 })();